@@ -0,0 +1,20 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite, в котором транзакция может сразу брать блокировку записи.
+
+    Django 2.2 начинает транзакцию atomic() с BEGIN (DEFERRED): блокировка
+    записи берется только первым изменяющим запросом, и если другой
+    писатель успел раньше, транзакция, уже читавшая данные, получает
+    "database is locked" без ожидания timeout. Пока включен
+    begin_immediate (core.db.immediate_atomic), транзакция начинается
+    с BEGIN IMMEDIATE и ждет блокировку сразу.
+    """
+    begin_immediate = False
+
+    def _start_transaction_under_autocommit(self):
+        if self.begin_immediate:
+            self.cursor().execute('BEGIN IMMEDIATE')
+        else:
+            super()._start_transaction_under_autocommit()
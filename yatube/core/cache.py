@@ -0,0 +1,344 @@
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .metrics import record_cache
+
+MISSING = object()
+
+
+class SQLiteCache(BaseCache):
+    """Общий для процессов кеш в файле SQLite.
+
+    Замена Redis там, где его нет: в разработке и в тестах.
+    LOCATION - путь к файлу, incr и add атомарны.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+        self._sets = 0
+
+    @property
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self._path, timeout=10,
+                                 isolation_level=None,
+                                 check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute('CREATE TABLE IF NOT EXISTS cache ('
+                       'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                       'expires REAL)')
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _write(self):
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    @staticmethod
+    def _alive(expires):
+        return expires is None or expires > time.time()
+
+    def _cull(self, db):
+        db.execute('DELETE FROM cache WHERE expires <= ?', [time.time()])
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                [count // self._cull_frequency],
+            )
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        row = self._db.execute('SELECT value, expires FROM cache '
+                               'WHERE key = ?', [key]).fetchone()
+        if row is None or not self._alive(row[1]):
+            return default
+        return pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        names = {self._key(key, version): key for key in keys}
+        if not names:
+            return {}
+        placeholders = ', '.join('?' * len(names))
+        rows = self._db.execute(
+            f'SELECT key, value, expires FROM cache '
+            f'WHERE key IN ({placeholders})', list(names)).fetchall()
+        return {names[key]: pickle.loads(value)
+                for key, value, expires in rows if self._alive(expires)}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [
+            (self._key(key, version),
+             pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires)
+            for key, value in data.items()
+        ]
+        with self._write() as db:
+            db.executemany('INSERT OR REPLACE INTO cache '
+                           '(key, value, expires) VALUES (?, ?, ?)', rows)
+            self._sets += 1
+            if self._sets % 100 == 0:
+                self._cull(db)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as db:
+            db.execute('DELETE FROM cache WHERE key = ? AND expires <= ?',
+                       [key, time.time()])
+            cursor = db.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                [key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                 self.get_backend_timeout(timeout)],
+            )
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as db:
+            cursor = db.execute(
+                'UPDATE cache SET expires = ? WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                [self.get_backend_timeout(timeout), key, time.time()],
+            )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        name = self._key(key, version)
+        with self._write() as db:
+            row = db.execute('SELECT value, expires FROM cache '
+                             'WHERE key = ?', [name]).fetchone()
+            if row is None or not self._alive(row[1]):
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            db.execute('UPDATE cache SET value = ? WHERE key = ?',
+                       [pickle.dumps(value, pickle.HIGHEST_PROTOCOL), name])
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, MISSING, version) is not MISSING
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        names = [self._key(key, version) for key in keys]
+        with self._write() as db:
+            db.executemany('DELETE FROM cache WHERE key = ?',
+                           [(name,) for name in names])
+
+    def clear(self):
+        with self._write() as db:
+            db.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # соединение остается открытым между запросами потока
+        pass
+
+
+class LocalTier:
+    """LRU в памяти процесса, общий для всех потоков"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            expires, data = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+        return pickle.loads(data)
+
+    def set(self, key, value, ttl):
+        # копия, чтобы изменения объекта не попадали в кеш
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, data)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# Django создает экземпляр кеша на каждый поток,
+# а L1 должен быть один на процесс
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+    """Двухуровневый кеш: LRU в памяти процесса перед общим кешем.
+
+    L2 - другой кеш из CACHES (Redis или SQLiteCache), общий для всех
+    процессов. L1 держит до L1_MAX_ENTRIES значений не дольше
+    L1_TIMEOUT секунд. В L1 попадают только ключи с префиксами из
+    L1_PREFIXES - неизменяемые по ключу значения: ключи страниц
+    и карточек содержат номера поколений, и после сброса поколения
+    процесс просто читает новый ключ. Все остальные ключи (поколения,
+    счетчики, блокировки, ключи сторонних приложений) читаются из L2,
+    чтобы изменение в одном процессе сразу видели другие.
+    Попадания в L1, L2 и промахи учитываются в показателях запроса
+    (core.metrics).
+    """
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options.get('L2', server)
+        self._l1_timeout = options.get('L1_TIMEOUT', 60)
+        self._l1_prefixes = tuple(options.get('L1_PREFIXES', ()))
+        with _local_tiers_lock:
+            self._local = _local_tiers.setdefault(
+                server or self._l2_alias,
+                LocalTier(int(options.get('L1_MAX_ENTRIES', 1000))))
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _l1_key(self, key, version):
+        if not key.startswith(self._l1_prefixes):
+            return None
+        return self.l2.make_key(key, version=version)
+
+    def _l1_set(self, l1_key, value, timeout=DEFAULT_TIMEOUT):
+        if l1_key is None:
+            return
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.l2.default_timeout
+        if timeout is not None and timeout <= 0:
+            self._l1_discard(l1_key)
+            return
+        ttl = self._l1_timeout if timeout is None else min(
+            timeout, self._l1_timeout)
+        self._local.set(l1_key, value, ttl)
+
+    def _l1_discard(self, *l1_keys):
+        self._local.discard(*l1_keys)
+
+    def get(self, key, default=None, version=None):
+        l1_key = self._l1_key(key, version)
+        if l1_key is not None:
+            value = self._local.get(l1_key)
+            if value is not MISSING:
+                record_cache('l1')
+                return value
+        value = self.l2.get(key, MISSING, version=version)
+        if value is MISSING:
+            record_cache('miss')
+            return default
+        record_cache('l2')
+        self._l1_set(l1_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            l1_key = self._l1_key(key, version)
+            value = MISSING if l1_key is None else self._local.get(l1_key)
+            if value is MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        record_cache('l1', len(found))
+        if missing:
+            fetched = self.l2.get_many(missing, version=version)
+            for key, value in fetched.items():
+                self._l1_set(self._l1_key(key, version), value)
+            found.update(fetched)
+            record_cache('l2', len(fetched))
+            record_cache('miss', len(missing) - len(fetched))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version=version)
+        self._l1_set(self._l1_key(key, version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version=version) or []
+        for key, value in data.items():
+            if key not in failed:
+                self._l1_set(self._l1_key(key, version), value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version=version)
+        if added:
+            self._l1_set(self._l1_key(key, version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._l1_discard(self._l1_key(key, version))
+        return self.l2.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version=version)
+
+    def has_key(self, key, version=None):
+        l1_key = self._l1_key(key, version)
+        if l1_key is not None and self._local.get(l1_key) is not MISSING:
+            return True
+        return self.l2.has_key(key, version=version)
+
+    def delete(self, key, version=None):
+        self._l1_discard(self._l1_key(key, version))
+        self.l2.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        self._l1_discard(*(self._l1_key(key, version) for key in keys))
+        self.l2.delete_many(keys, version=version)
+
+    def clear(self):
+        self._local.clear()
+        self.l2.clear()
+
+    def clear_local(self):
+        """Очищает только L1 этого процесса"""
+        self._local.clear()
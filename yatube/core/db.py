@@ -0,0 +1,62 @@
+import sqlite3
+from contextlib import ExitStack, closing, contextmanager
+
+from django.conf import settings
+from django.db import connections, transaction
+
+
+def is_locked_error(exc):
+    """Ошибка SQLite о занятой другим соединением базе"""
+    return 'database is locked' in str(exc)
+
+
+@contextmanager
+def execute_wrapper_everywhere(wrapper):
+    """execute_wrapper на всех базах сразу: основной и репликах"""
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(wrapper))
+        yield
+
+
+@contextmanager
+def immediate_atomic(using=None):
+    """transaction.atomic(), внешняя транзакция которого в SQLite
+    начинается с BEGIN IMMEDIATE (core.backends.sqlite3).
+
+    Внутри уже открытой транзакции это обычная точка сохранения.
+    """
+    connection = transaction.get_connection(using)
+    previous = getattr(connection, 'begin_immediate', False)
+    connection.begin_immediate = True
+    try:
+        with transaction.atomic(using):
+            connection.begin_immediate = previous
+            yield
+    finally:
+        connection.begin_immediate = previous
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Настраивает каждое новое соединение с SQLite.
+
+    WAL позволяет читать во время записи, synchronous=NORMAL в режиме
+    WAL не теряет согласованность при сбое, mmap и увеличенный кеш
+    страниц сокращают чтения с диска.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def copy_database(source, target):
+    """Копирует файл SQLite в другой файл через backup API.
+
+    Замена настоящей репликации для локальной проверки реплик:
+    копия согласована, даже если в источник в это время пишут.
+    """
+    with closing(sqlite3.connect(source)) as primary, \
+            closing(sqlite3.connect(target)) as replica:
+        primary.backup(replica)
@@ -0,0 +1,111 @@
+import logging
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError
+from django.http import HttpRequest
+
+from .db import execute_wrapper_everywhere, immediate_atomic, is_locked_error
+from .routers import replica_reads
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+# управление транзакциями не считается запросом к данным
+TRANSACTION_STATEMENTS = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT',
+                          'ROLLBACK TO SAVEPOINT')
+
+
+class QueryCounter:
+    """execute_wrapper, который считает выполненные SQL-запросы"""
+
+    def __init__(self):
+        self.count = 0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.startswith(TRANSACTION_STATEMENTS):
+            self.count += 1
+            self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+
+def query_budget(max_queries):
+    """Ограничивает число SQL-запросов представления.
+
+    При превышении пишет предупреждение в лог, а при включенной
+    настройке QUERY_BUDGET_RAISE (в тестах) выбрасывает исключение.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            counter = QueryCounter()
+            with execute_wrapper_everywhere(counter):
+                response = view(request, *args, **kwargs)
+            if counter.count > max_queries:
+                message = (
+                    f'{view.__module__}.{view.__name__}: '
+                    f'{counter.count} SQL-запросов при бюджете {max_queries}'
+                )
+                if settings.QUERY_BUDGET_RAISE:
+                    raise QueryBudgetExceeded(
+                        message + '\n' + '\n'.join(counter.queries))
+                logger.warning(message, extra={'path': request.path})
+            return response
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
+
+
+def retry_on_locked(func):
+    """Повторяет изменяющую функцию, если база SQLite занята.
+
+    В режиме WAL читатели не мешают записи, но два писателя все равно
+    конкурируют за блокировку. Транзакция начинается с BEGIN IMMEDIATE:
+    блокировка записи берется сразу с ожиданием timeout, а не первым
+    изменяющим запросом после чтений, который получил бы
+    "database is locked" без ожидания. Поэтому оборачивать стоит только
+    сами запросы записи: проверку формы, обработку картинок, запись
+    файлов и шаблоны - до или после. Запрос представления с безопасным
+    методом (GET, HEAD) выполняется без транзакции.
+
+    Каждая попытка выполняется в своей транзакции и при ошибке
+    откатывается целиком, поэтому повтор не оставляет половины
+    изменений. Паузы между попытками растут экспоненциально
+    со случайным разбросом.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        request = args[0] if args else None
+        if isinstance(request, HttpRequest) and request.method in SAFE_METHODS:
+            return func(*args, **kwargs)
+        retries = settings.SQLITE_LOCKED_RETRIES
+        delay = settings.SQLITE_LOCKED_RETRY_DELAY
+        for attempt in range(retries + 1):
+            try:
+                with immediate_atomic():
+                    return func(*args, **kwargs)
+            except OperationalError as exc:
+                if attempt == retries or not is_locked_error(exc):
+                    raise
+                logger.info('%s: база занята, попытка %s',
+                            func.__name__, attempt + 2)
+                time.sleep(delay * 2 ** attempt * random.uniform(0.5, 1.5))
+    return wrapper
+
+
+def read_replica(view):
+    """Чтения представления идут на реплики (core.routers)"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from django.conf import settings
+
+from core.db import copy_database
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файлы реплик. '
+            'Заменяет репликацию при локальной проверке DATABASE_REPLICAS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Повторять копирование каждые N секунд')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('Реплики не заданы: YATUBE_REPLICAS')
+        databases = settings.DATABASES
+        # по vendor, а не по ENGINE: основная база работает через
+        # core.backends.sqlite3
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+            raise CommandError('Копирование работает только для SQLite')
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                copy_database(databases[DEFAULT_DB_ALIAS]['NAME'],
+                              databases[alias]['NAME'])
+                self.stdout.write(f'{alias}: скопирована')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
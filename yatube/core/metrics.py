@@ -0,0 +1,71 @@
+import threading
+import time
+from contextlib import contextmanager
+
+_current = threading.local()
+
+
+class RequestMetrics:
+    """Показатели одного запроса: SQL, шаблоны и кеш.
+
+    Если capture_sql, запоминаются тексты запросов и их время, чтобы
+    показать их в логе медленного запроса (не больше max_queries).
+    """
+
+    def __init__(self, capture_sql=False, max_queries=50):
+        self.capture_sql = capture_sql
+        self.max_queries = max_queries
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.cache = {'l1': 0, 'l2': 0, 'miss': 0}
+        self.sql = []
+        self._template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper: считает запросы и их время"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if self.capture_sql and len(self.sql) < self.max_queries:
+                self.sql.append((elapsed, sql))
+
+    @contextmanager
+    def template(self):
+        """Время отрисовки шаблона; вложенные отрисовки не суммируются"""
+        self._template_depth += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._template_depth -= 1
+            if not self._template_depth:
+                self.template_time += time.perf_counter() - started
+
+    def slowest_sql(self, limit=10):
+        return sorted(self.sql, reverse=True)[:limit]
+
+
+def current_metrics():
+    """Показатели запроса, который обрабатывает этот поток, или None"""
+    return getattr(_current, 'metrics', None)
+
+
+@contextmanager
+def collect(metrics):
+    _current.metrics = metrics
+    try:
+        yield metrics
+    finally:
+        _current.metrics = None
+
+
+def record_cache(tier, count=1):
+    """Отмечает попадание (tier l1/l2) или промах (miss) кеша"""
+    metrics = current_metrics()
+    if metrics is not None and count:
+        metrics.cache[tier] += count
@@ -0,0 +1,121 @@
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .db import execute_wrapper_everywhere
+from .metrics import RequestMetrics, collect
+from .routers import pinned_to_primary
+
+logger = logging.getLogger('yatube.performance')
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class PerformanceMiddleware:
+    """Пишет показатели запроса в лог yatube.performance одной строкой JSON.
+
+    Доля PERF_LOG_SAMPLE_RATE запросов измеряется полностью (SQL, шаблоны,
+    кеш) и пишется в лог. Запросы дольше PERF_SLOW_REQUEST_MS пишутся
+    всегда с уровнем WARNING: попавшие в выборку - с самыми долгими
+    SQL-запросами, остальные - только со временем, потому что для них
+    засекается одно время ответа.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sampled = random.random() < settings.PERF_LOG_SAMPLE_RATE
+        slow_ms = settings.PERF_SLOW_REQUEST_MS
+        if not sampled and slow_ms is None:
+            return self.get_response(request)
+        metrics = None
+        started = time.perf_counter()
+        if sampled:
+            metrics = RequestMetrics(
+                capture_sql=slow_ms is not None,
+                max_queries=settings.PERF_SLOW_MAX_QUERIES)
+            with collect(metrics), execute_wrapper_everywhere(metrics):
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        slow = slow_ms is not None and elapsed_ms >= slow_ms
+        if sampled or slow:
+            self.log(request, response, metrics, elapsed_ms, slow)
+        return response
+
+    def log(self, request, response, metrics, elapsed_ms, slow):
+        match = request.resolver_match
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'duration_ms': round(elapsed_ms, 2),
+            'response_bytes': (None if response.streaming
+                               else len(response.content)),
+        }
+        if metrics is not None:
+            record.update({
+                'db_queries': metrics.queries,
+                'db_ms': round(metrics.db_time * 1000, 2),
+                'template_ms': round(metrics.template_time * 1000, 2),
+                'cache_l1_hits': metrics.cache['l1'],
+                'cache_l2_hits': metrics.cache['l2'],
+                'cache_misses': metrics.cache['miss'],
+            })
+        if slow:
+            record['slow'] = True
+        if slow and metrics is not None:
+            record['sql'] = [
+                {'ms': round(elapsed * 1000, 2), 'sql': sql}
+                for elapsed, sql in metrics.slowest_sql()
+            ]
+        logger.log(logging.WARNING if slow else logging.INFO,
+                   json.dumps(record, ensure_ascii=False),
+                   extra={'metrics': record})
+
+
+class WriteDetector:
+    """execute_wrapper, который замечает изменяющие SQL-запросы"""
+
+    def __init__(self):
+        self.wrote = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith(WRITE_STATEMENTS):
+            self.wrote = True
+        return execute(sql, params, many, context)
+
+
+class ReplicaPinningMiddleware:
+    """Читает из основной базы после записи пользователя.
+
+    Если запрос что-то записал (POST или запись в базу при GET, как у
+    подписки), ответ ставит cookie REPLICA_PIN_COOKIE на
+    REPLICA_PIN_SECONDS. Пока cookie есть, чтения этого пользователя
+    не уходят на реплики, и он видит свои изменения, даже если реплика
+    отстает.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        unsafe = request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        pinned = unsafe or settings.REPLICA_PIN_COOKIE in request.COOKIES
+        detector = WriteDetector()
+        with pinned_to_primary(pinned), connection.execute_wrapper(detector):
+            response = self.get_response(request)
+        if unsafe or detector.wrote:
+            response.set_cookie(settings.REPLICA_PIN_COOKIE, '1',
+                                max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,63 @@
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = threading.local()
+
+
+@contextmanager
+def replica_reads():
+    """Разрешает чтение с реплик внутри блока"""
+    previous = getattr(_state, 'replica', False)
+    _state.replica = True
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+@contextmanager
+def pinned_to_primary(pinned=True):
+    """Внутри блока все чтения идут в основную базу"""
+    previous = getattr(_state, 'pinned', False)
+    _state.pinned = pinned or previous
+    try:
+        yield
+    finally:
+        _state.pinned = previous
+
+
+def reads_from_replica():
+    return (getattr(_state, 'replica', False)
+            and not getattr(_state, 'pinned', False)
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block)
+
+
+class PrimaryReplicaRouter:
+    """Чтение с реплик из DATABASE_REPLICAS, запись - в default.
+
+    С реплик читают только представления, отмеченные
+    core.decorators.read_replica, и только если пользователь недавно
+    ничего не менял (core.middleware.ReplicaPinningMiddleware), иначе
+    он мог бы не увидеть свою запись из-за отставания реплики.
+    Внутри транзакции чтения тоже идут в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and reads_from_replica():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики содержат те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схема попадает на реплики вместе с данными
+        return db == DEFAULT_DB_ALIAS
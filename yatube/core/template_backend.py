@@ -0,0 +1,27 @@
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+
+from .metrics import current_metrics
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        metrics = current_metrics()
+        if metrics is None:
+            return super().render(context, request)
+        with metrics.template():
+            return super().render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Стандартный движок шаблонов, который сообщает время отрисовки
+    в показатели запроса (core.middleware.PerformanceMiddleware)"""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+
+def shared(directory):
+    return {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(directory, 'cache.sqlite3'),
+    }
+
+
+def tier(location, max_entries=100):
+    return {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': location,
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_MAX_ENTRIES': max_entries,
+            'L1_PREFIXES': ('page:', 'post_card:'),
+        },
+    }
+
+
+class SharedCacheTestCase(SimpleTestCase):
+    """Тесты со своим файлом общего кеша: каталог создается и удаляется
+    вместе с классом, поэтому классы не зависят от порядка запуска"""
+    workers = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cache_dir = tempfile.mkdtemp()
+        cls.cache_settings = override_settings(CACHES={
+            **cls.workers, 'shared': shared(cls.cache_dir)})
+        cls.cache_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.cache_settings.disable()
+        shutil.rmtree(cls.cache_dir, ignore_errors=True)
+
+
+class TieredCacheTest(SharedCacheTestCase):
+    """Два алиаса с разным LOCATION изображают два процесса"""
+    workers = {
+        'default': tier('worker-1', max_entries=2),
+        'worker_2': tier('worker-2'),
+    }
+
+    def setUp(self):
+        self.worker_1 = caches['default']
+        self.worker_2 = caches['worker_2']
+        self.shared = caches['shared']
+        self.worker_1.clear()
+        self.worker_2.clear_local()
+
+    def test_values_shared_between_workers(self):
+        self.worker_1.set('page:index', 'html', 60)
+        self.assertEqual(self.worker_2.get('page:index'), 'html')
+        self.worker_2.delete('page:index')
+        self.assertIsNone(self.shared.get('page:index'))
+
+    def test_l1_serves_only_listed_prefixes(self):
+        self.worker_1.set('page:index', 'html', 60)
+        self.worker_1.set('generation:all', 1, None)
+        self.shared.clear()
+        self.assertEqual(self.worker_1.get('page:index'), 'html')
+        self.assertIsNone(self.worker_1.get('generation:all'))
+
+    def test_other_keys_seen_by_all_workers(self):
+        """ключи сторонних приложений (kvstore миниатюр) не застревают в L1"""
+        self.worker_1.get('thumbnail||image')
+        self.worker_1.set('thumbnail||image', 'empty', 60)
+        self.worker_2.set('thumbnail||image', 'ready', 60)
+        self.assertEqual(self.worker_1.get('thumbnail||image'), 'ready')
+
+    def test_generation_bump_visible_to_other_worker(self):
+        self.worker_1.set('generation:all', 1, None)
+        self.assertEqual(self.worker_2.get('generation:all'), 1)
+        self.worker_1.incr('generation:all')
+        self.assertEqual(self.worker_2.get('generation:all'), 2)
+
+    def test_l1_is_bounded_lru(self):
+        for key in ('page:a', 'page:b', 'page:c'):
+            self.worker_1.set(key, key, 60)
+        self.shared.clear()
+        self.assertIsNone(self.worker_1.get('page:a'))
+        self.assertEqual(self.worker_1.get_many(['page:b', 'page:c']),
+                         {'page:b': 'page:b', 'page:c': 'page:c'})
+
+    def test_l1_returns_copies(self):
+        self.worker_1.set('page:index', {'headers': []}, 60)
+        self.worker_1.get('page:index')['headers'].append('Vary')
+        self.assertEqual(self.worker_1.get('page:index'), {'headers': []})
+
+    def test_sqlite_cache_add_incr_and_expiry(self):
+        self.assertTrue(self.shared.add('lock:x', 1, 60))
+        self.assertFalse(self.shared.add('lock:x', 2, 60))
+        self.assertEqual(self.shared.incr('lock:x', 5), 6)
+        self.shared.set('short', 1, 0)
+        self.assertIsNone(self.shared.get('short'))
+        with self.assertRaises(ValueError):
+            self.shared.incr('short')
@@ -0,0 +1,38 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import warnings
+from contextlib import closing
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+
+class SyncReplicasCommandTest(SimpleTestCase):
+    def test_replicas_copied_with_project_engine(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        primary = os.path.join(directory, 'primary.sqlite3')
+        replica = os.path.join(directory, 'replica.sqlite3')
+        with closing(sqlite3.connect(primary)) as db:
+            db.execute('CREATE TABLE post (text TEXT)')
+            db.commit()
+        # ENGINE тот же, что в настройках проекта, меняются только файлы
+        default = settings.DATABASES['default']
+        databases = {
+            'default': dict(default, NAME=primary),
+            'replica_0': dict(default, NAME=replica),
+        }
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            with override_settings(DATABASES=databases,
+                                   DATABASE_REPLICAS=['replica_0']):
+                out = StringIO()
+                call_command('sync_replicas', stdout=out)
+        self.assertIn('replica_0', out.getvalue())
+        with closing(sqlite3.connect(replica)) as db:
+            self.assertEqual(
+                db.execute('SELECT count(*) FROM post').fetchone(), (0,))
@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.test import (
+    RequestFactory, TestCase, TransactionTestCase, override_settings
+)
+
+from core.decorators import retry_on_locked
+from posts.models import Group
+
+
+@override_settings(SQLITE_LOCKED_RETRY_DELAY=0)
+class RetryOnLockedTest(TestCase):
+    def test_locked_write_retried_without_partial_changes(self):
+        attempts = []
+
+        @retry_on_locked
+        def view(request):
+            Group.objects.create(title='Повтор', slug=f'retry-{len(attempts)}')
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OperationalError('database is locked')
+            return 'ok'
+
+        self.assertEqual(view(RequestFactory().post('/')), 'ok')
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(list(Group.objects.values_list('slug', flat=True)),
+                         ['retry-2'])
+
+    @override_settings(SQLITE_LOCKED_RETRIES=1)
+    def test_other_errors_and_last_attempt_raise(self):
+        @retry_on_locked
+        def locked(request):
+            raise OperationalError('database is locked')
+
+        @retry_on_locked
+        def broken(request):
+            raise OperationalError('no such table')
+
+        for view in (locked, broken):
+            with self.subTest(view=view.__name__):
+                with self.assertRaises(OperationalError):
+                    view(RequestFactory().post('/'))
+
+    def test_sqlite_pragmas_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0],
+                             settings.SQLITE_PRAGMAS['cache_size'])
+
+
+class ImmediateTransactionTest(TransactionTestCase):
+    def test_write_lock_taken_when_transaction_begins(self):
+        statements = []
+
+        def capture(execute, sql, params, many, context):
+            statements.append(sql)
+            return execute(sql, params, many, context)
+
+        @retry_on_locked
+        def view(request):
+            return Group.objects.count()
+
+        with connection.execute_wrapper(capture):
+            view(RequestFactory().post('/'))
+            Group.objects.count()
+        self.assertEqual(statements[0], 'BEGIN IMMEDIATE')
+        # вне retry_on_locked транзакции остаются отложенными
+        self.assertFalse(connection.begin_immediate)
+
+    def test_safe_method_runs_without_transaction(self):
+        @retry_on_locked
+        def view(request):
+            return connection.in_atomic_block
+
+        self.assertFalse(view(RequestFactory().get('/')))
+        self.assertTrue(view(RequestFactory().post('/')))
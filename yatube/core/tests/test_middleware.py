@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post, User
+
+
+@override_settings(PERF_LOG_SAMPLE_RATE=1, PERF_SLOW_REQUEST_MS=None)
+class PerformanceMiddlewareTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='perf_author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def logged(self, url):
+        with self.assertLogs('yatube.performance') as logs:
+            response = self.client.get(url)
+        record = logs.records[-1].metrics
+        return response, record
+
+    def test_request_metrics_logged(self):
+        response, record = self.logged(reverse('posts:index'))
+        self.assertEqual(record['view'], 'posts:index')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['db_queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+        self.assertGreater(record['cache_misses'], 0)
+        self.assertEqual(record['response_bytes'], len(response.content))
+        self.assertNotIn('sql', record)
+        _, record = self.logged(reverse('posts:index'))
+        self.assertEqual(record['db_queries'], 0)
+        self.assertGreater(record['cache_l1_hits'] + record['cache_l2_hits'],
+                           0)
+
+    @override_settings(PERF_SLOW_REQUEST_MS=0)
+    def test_slow_request_logged_with_sql(self):
+        with self.assertLogs('yatube.performance', 'WARNING') as logs:
+            self.client.get(
+                reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        record = logs.records[-1].metrics
+        self.assertTrue(record['slow'])
+        self.assertTrue(any('posts_post' in query['sql']
+                            for query in record['sql']))
+
+    @override_settings(PERF_LOG_SAMPLE_RATE=0, PERF_SLOW_REQUEST_MS=0)
+    def test_unsampled_slow_request_logged_without_sql(self):
+        with mock.patch('core.middleware.execute_wrapper_everywhere') as wrap:
+            with self.assertLogs('yatube.performance', 'WARNING') as logs:
+                self.client.get(reverse('posts:index'))
+        wrap.assert_not_called()
+        record = logs.records[-1].metrics
+        self.assertTrue(record['slow'])
+        self.assertNotIn('sql', record)
+        self.assertNotIn('db_queries', record)
+
+    @override_settings(PERF_LOG_SAMPLE_RATE=0, PERF_SLOW_REQUEST_MS=None)
+    def test_unsampled_request_not_logged(self):
+        with self.assertRaises(AssertionError):
+            with self.assertLogs('yatube.performance'):
+                self.client.get(reverse('posts:index'))
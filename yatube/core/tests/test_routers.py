@@ -0,0 +1,73 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from contextlib import closing
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, override_settings
+)
+from django.urls import reverse
+
+from core.db import copy_database
+from core.decorators import read_replica
+from core.middleware import ReplicaPinningMiddleware
+from core.routers import PrimaryReplicaRouter
+from posts.models import Post, User
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+        @read_replica
+        def view(request):
+            return HttpResponse(self.router.db_for_read(Post))
+
+        self.middleware = ReplicaPinningMiddleware(view)
+
+    def test_only_marked_views_read_from_replica(self):
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+        response = self.middleware(self.factory.get('/'))
+        self.assertEqual(response.content, b'replica')
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_write_pins_user_to_primary(self):
+        response = self.middleware(self.factory.post('/'))
+        self.assertEqual(response.content, b'default')
+        self.assertEqual(
+            response.cookies[settings.REPLICA_PIN_COOKIE]['max-age'],
+            settings.REPLICA_PIN_SECONDS)
+        request = self.factory.get('/')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE] = '1'
+        self.assertEqual(self.middleware(request).content, b'default')
+
+    def test_replica_file_synced_from_primary(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        primary = os.path.join(directory, 'primary.sqlite3')
+        replica = os.path.join(directory, 'replica.sqlite3')
+        with closing(sqlite3.connect(primary)) as db:
+            db.execute('CREATE TABLE post (text TEXT)')
+            db.execute("INSERT INTO post VALUES ('с основной базы')")
+            db.commit()
+        copy_database(primary, replica)
+        with closing(sqlite3.connect(replica)) as db:
+            self.assertEqual(db.execute('SELECT text FROM post').fetchall(),
+                             [('с основной базы',)])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaPinningTest(TestCase):
+    def test_write_by_get_pins_to_primary(self):
+        author = User.objects.create_user(username='pinned_author')
+        reader = User.objects.create_user(username='pinned_reader')
+        self.client.force_login(reader)
+        response = self.client.get(reverse(
+            'posts:profile_follow', kwargs={'username': author.username}))
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
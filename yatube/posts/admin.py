@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Post, Group, Follow, Comment
+from .models import Post, Group, Follow, Comment, UserStats
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -8,7 +8,8 @@ class PostAdmin(admin.ModelAdmin):
                     'image',
                     'pub_date',
                     'author',
-                    'group'
+                    'group',
+                    'comments_count',
                     )
     list_editable = ('group',)
     search_fields = ('text',)
@@ -42,7 +43,21 @@ class CommentAdmin(admin.ModelAdmin):
     list_filter = ('created',)
 
 
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = ('user',
+                    'posts_count',
+                    'followers_count',
+                    'following_count',
+                    )
+    readonly_fields = ('posts_count',
+                       'followers_count',
+                       'following_count',
+                       )
+    search_fields = ('user__username',)
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Follow, FollowAdmin)
 admin.site.register(Comment, CommentAdmin)
+admin.site.register(UserStats, UserStatsAdmin)
@@ -0,0 +1,299 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET, require_POST
+
+from core.decorators import query_budget, read_replica
+
+from .follows import add_follows, remove_follows, resolve_users
+from .models import Comment, Follow, Group, Post
+from django.conf import settings as yatube_conf
+
+
+def isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def image_url(name):
+    if not name:
+        return None
+    return Post._meta.get_field('image').storage.url(name)
+
+
+class Resource:
+    """Описание ресурса API поверх .values().
+
+    fields - {имя в ответе: (путь ORM, преобразование или None)}.
+    Запрашиваются только пути выбранных полей, поэтому JOIN к автору
+    или группе появляется, только если их поля нужны в ответе.
+    ordering - поле курсора (по убыванию, вместе с id) или None для
+    сортировки по id по возрастанию.
+    """
+
+    def __init__(self, queryset, fields, default_fields, ordering=None,
+                 filters=None, lookup='pk', private=False):
+        self.queryset = queryset
+        self.fields = fields
+        self.default_fields = default_fields
+        self.ordering = ordering
+        self.filters = filters or {}
+        self.lookup = lookup
+        self.private = private
+
+    def get_queryset(self, request):
+        queryset = self.queryset
+        if self.private:
+            queryset = queryset.filter(
+                Q(user=request.user) | Q(author=request.user))
+        return queryset
+
+    def plan(self, requested):
+        """Список (имя, путь, преобразование) для запрошенных полей"""
+        if not requested:
+            names = self.default_fields
+        else:
+            names = [name for name in requested.split(',') if name]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ValueError(f'Неизвестные поля: {", ".join(unknown)}')
+        return [(name, *self.fields[name]) for name in names]
+
+    def cursor_value(self, value):
+        """Значение из курсора, приведенное к типу поля сортировки"""
+        field = self.queryset.model._meta.get_field(self.ordering)
+        try:
+            value = field.to_python(value) if isinstance(value, str) else None
+        except ValidationError:
+            value = None
+        if value is None:
+            raise ValueError('Некорректный курсор')
+        return value
+
+    def cursor_filter(self, cursor):
+        value, pk = cursor
+        if self.ordering is None:
+            return Q(pk__gt=pk)
+        value = self.cursor_value(value)
+        return (Q(**{f'{self.ordering}__lt': value})
+                | Q(**{self.ordering: value, 'pk__lt': pk}))
+
+    def order_by(self):
+        if self.ordering is None:
+            return ('pk',)
+        return (f'-{self.ordering}', '-pk')
+
+    def cursor_for(self, row):
+        value = row[self.ordering] if self.ordering else None
+        return encode_api_cursor(value, row['pk'])
+
+
+def encode_api_cursor(value, pk):
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    raw = json.dumps([value, pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_api_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError('Некорректный курсор')
+    if not isinstance(pk, int):
+        raise ValueError('Некорректный курсор')
+    return value, pk
+
+
+RESOURCES = {
+    'posts': Resource(
+        Post.objects.all(),
+        fields={
+            'id': ('pk', None),
+            'text': ('text', None),
+            'pub_date': ('pub_date', isoformat),
+            'author': ('author__username', None),
+            'group': ('group__slug', None),
+            'group_title': ('group__title', None),
+            'image': ('image', image_url),
+            'image_width': ('image_width', None),
+            'image_height': ('image_height', None),
+            'comments_count': ('comments_count', None),
+        },
+        default_fields=['id', 'text', 'pub_date', 'author', 'group',
+                        'image', 'comments_count'],
+        ordering='pub_date',
+        filters={'group': 'group__slug', 'author': 'author__username'},
+    ),
+    'groups': Resource(
+        Group.objects.all(),
+        fields={
+            'id': ('pk', None),
+            'title': ('title', None),
+            'slug': ('slug', None),
+            'description': ('description', None),
+        },
+        default_fields=['id', 'title', 'slug', 'description'],
+        lookup='slug',
+    ),
+    'comments': Resource(
+        Comment.objects.all(),
+        fields={
+            'id': ('pk', None),
+            'post': ('post_id', None),
+            'author': ('author__username', None),
+            'text': ('text', None),
+            'created': ('created', isoformat),
+            'parent': ('parent_id', None),
+            'thread': ('thread_id', None),
+        },
+        default_fields=['id', 'post', 'author', 'text', 'created',
+                        'parent'],
+        ordering='created',
+        filters={'post': 'post_id', 'author': 'author__username',
+                 'thread': 'thread_id'},
+    ),
+    'follows': Resource(
+        Follow.objects.all(),
+        fields={
+            'id': ('pk', None),
+            'user': ('user__username', None),
+            'author': ('author__username', None),
+        },
+        default_fields=['id', 'user', 'author'],
+        filters={'user': 'user__username', 'author': 'author__username'},
+        private=True,
+    ),
+}
+
+
+def serialize(rows, plan):
+    """Превращает строки .values() в словари ответа без моделей"""
+    return [
+        {name: convert(row[path]) if convert else row[path]
+         for name, path, convert in plan}
+        for row in rows
+    ]
+
+
+def error(message, status=400):
+    return JsonResponse({'detail': message}, status=status,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def api_response(data):
+    return JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+
+
+def page_limit(request):
+    limit = request.GET.get('limit')
+    if limit is None:
+        return yatube_conf.COUNT_POSTS_IN_PAGE
+    limit = int(limit)
+    if limit < 1:
+        raise ValueError('limit должен быть положительным')
+    return min(limit, yatube_conf.API_MAX_LIMIT)
+
+
+@query_budget(3)
+@read_replica
+@require_GET
+def api_list(request, resource):
+    """Список объектов ресурса с курсором ?cursor= и полями ?fields="""
+    resource = RESOURCES[resource]
+    if resource.private and not request.user.is_authenticated:
+        return error('Требуется авторизация', status=401)
+    try:
+        plan = resource.plan(request.GET.get('fields'))
+        limit = page_limit(request)
+        cursor = request.GET.get('cursor')
+        queryset = resource.get_queryset(request).filter(**{
+            path: request.GET[name]
+            for name, path in resource.filters.items()
+            if name in request.GET
+        })
+        if cursor:
+            queryset = queryset.filter(
+                resource.cursor_filter(decode_api_cursor(cursor)))
+        paths = {path for _, path, _ in plan} | {'pk'}
+        if resource.ordering:
+            paths.add(resource.ordering)
+        rows = list(queryset.order_by(*resource.order_by())
+                    .values(*paths)[:limit + 1])
+    except ValueError as exc:
+        return error(str(exc))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = resource.cursor_for(rows[-1])
+    return api_response({
+        'results': serialize(rows, plan),
+        'next_cursor': next_cursor,
+    })
+
+
+@query_budget(3)
+@read_replica
+@require_GET
+def api_detail(request, resource, key):
+    """Один объект ресурса по id (группа - по slug)"""
+    resource = RESOURCES[resource]
+    if resource.private and not request.user.is_authenticated:
+        return error('Требуется авторизация', status=401)
+    try:
+        plan = resource.plan(request.GET.get('fields'))
+        row = resource.get_queryset(request).filter(
+            **{resource.lookup: key}
+        ).values(*{path for _, path, _ in plan}).first()
+    except ValueError as exc:
+        return error(str(exc))
+    if row is None:
+        return error('Не найдено', status=404)
+    return api_response(serialize([row], plan)[0])
+
+
+def username_list(data, key):
+    names = data.get(key, [])
+    if (not isinstance(names, list)
+            or not all(isinstance(name, str) for name in names)):
+        raise ValueError(f'{key} должен быть списком имен')
+    return names
+
+
+@query_budget(16)
+@require_POST
+def api_follows_bulk(request):
+    """Подписка и отписка списками имен за постоянное число запросов.
+
+    Тело - JSON {"follow": [имена], "unfollow": [имена]}, не больше
+    FOLLOW_BULK_MAX имен. Ответ - на кого из названных пользователь
+    теперь подписан и от кого отписан, и неизвестные имена.
+    """
+    if not request.user.is_authenticated:
+        return error('Требуется авторизация', status=401)
+    try:
+        data = json.loads(request.body or '{}')
+        if not isinstance(data, dict):
+            raise ValueError('Ожидается объект JSON')
+        follow = username_list(data, 'follow')
+        unfollow = username_list(data, 'unfollow')
+    except ValueError as exc:
+        return error(str(exc))
+    if len(follow) + len(unfollow) > yatube_conf.FOLLOW_BULK_MAX:
+        return error(f'Не больше {yatube_conf.FOLLOW_BULK_MAX} имен')
+    users = resolve_users(follow + unfollow)
+    me = request.user.pk
+    followed = add_follows(
+        (me, users[name]) for name in follow if name in users)
+    unfollowed = remove_follows(
+        (me, users[name]) for name in unfollow if name in users)
+    names = {pk: name for name, pk in users.items()}
+    return api_response({
+        'followed': sorted(names[pk] for _, pk in followed),
+        'unfollowed': sorted(names[pk] for _, pk in unfollowed),
+        'unknown': sorted(set(follow + unfollow) - set(users)),
+    })
@@ -0,0 +1,289 @@
+import json
+import os
+import platform
+import random
+import threading
+import time
+import tracemalloc
+
+import django
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core.db import execute_wrapper_everywhere
+from core.decorators import QueryCounter
+
+from .models import Follow, Group, Post, User
+from .seeding import WORDS
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def scenarios():
+    """Сценарии {имя: (url, пользователь или None)} на данных из базы.
+
+    Берутся самые нагруженные объекты: самая большая группа, самый
+    активный автор, самый обсуждаемый пост и читатель с наибольшим
+    числом подписок.
+    """
+    group = Group.objects.annotate(total=Count('posts')).order_by(
+        '-total').first()
+    post = Post.objects.order_by('-comments_count', '-pk').first()
+    author = User.objects.filter(
+        stats__posts_count__gt=0).order_by('-stats__posts_count').first()
+    reader = User.objects.filter(
+        pk__in=Follow.objects.values('user_id')).order_by(
+        '-stats__following_count').first()
+    if None in (group, post, author, reader):
+        raise ValueError('Нужны посты, группы и подписки: seed_yatube')
+    index = reverse('posts:index')
+    return {
+        'index': (index, None),
+        'index, страница 50': (f'{index}?page=50', None),
+        'group_posts': (
+            reverse('posts:group_list', kwargs={'slug': group.slug}), None),
+        'profile': (reverse('posts:profile',
+                            kwargs={'username': author.username}), None),
+        'post_detail': (reverse('posts:post_detail',
+                                kwargs={'post_id': post.pk}), None),
+        'follow_index': (reverse('posts:follow_index'), reader),
+        'search': (f'{index}?q={WORDS[0]}+{WORDS[1]}', None),
+    }
+
+
+class Benchmark:
+    """Гоняет сценарии через тестовый клиент Django.
+
+    Для каждого запроса меряются время и число SQL-запросов, пиковая
+    память по tracemalloc снимается отдельным прогоном, чтобы
+    трассировка не искажала время. С cold кеш очищается перед
+    каждым запросом, иначе меряются страницы из кеша.
+    """
+
+    def __init__(self, requests=50, warmup=5, cold=False):
+        self.requests = requests
+        self.warmup = warmup
+        self.cold = cold
+        # адрес вне INTERNAL_IPS: debug toolbar не должен попадать в замеры
+        self.defaults = {'REMOTE_ADDR': '10.0.0.1'}
+
+    def client(self, user):
+        client = Client(**self.defaults)
+        if user is not None:
+            client.force_login(user)
+        return client
+
+    def request(self, client, url):
+        if self.cold:
+            cache.clear()
+        counter = QueryCounter()
+        with execute_wrapper_everywhere(counter):
+            started = time.perf_counter()
+            response = client.get(url)
+            elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            raise ValueError(f'{url}: ответ {response.status_code}')
+        return elapsed, counter.count
+
+    def peak_memory(self, client, url):
+        if self.cold:
+            cache.clear()
+        tracemalloc.start()
+        try:
+            client.get(url)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def measure(self, url, user):
+        client = self.client(user)
+        for _ in range(self.warmup):
+            self.request(client, url)
+        timings, queries = [], []
+        for _ in range(self.requests):
+            elapsed, count = self.request(client, url)
+            timings.append(elapsed * 1000)
+            queries.append(count)
+        result = {
+            f'p{percent}_ms': round(percentile(timings, percent), 3)
+            for percent in PERCENTILES
+        }
+        result['queries'] = max(queries)
+        result['peak_kib'] = round(self.peak_memory(client, url) / 1024, 1)
+        return result
+
+    def run(self, names=None):
+        results = {}
+        for name, (url, user) in scenarios().items():
+            if names and name not in names:
+                continue
+            results[name] = self.measure(url, user)
+        return results
+
+    def report(self, results):
+        return {
+            'mode': 'cold' if self.cold else 'warm',
+            'requests': self.requests,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'posts': Post.objects.count(),
+            'results': results,
+        }
+
+
+# профиль без настроек SQLite: журнал отката и без повторов записи
+PLAIN_PROFILE = {
+    'SQLITE_PRAGMAS': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'SQLITE_LOCKED_RETRIES': 0,
+}
+
+
+class ConcurrencyBenchmark:
+    """Одновременные чтения и записи в потоках.
+
+    Читатели открывают страницы постов и список постов API, писатели
+    оставляют комментарии. У каждого потока свое соединение с базой,
+    как у отдельного воркера. Результат - пропускная способность,
+    p95 и число ошибок "database is locked" для чтений и записей.
+    """
+
+    def __init__(self, readers=8, writers=2, duration=10.0):
+        self.readers = readers
+        self.writers = writers
+        self.duration = duration
+
+    def targets(self):
+        posts = list(Post.objects.order_by('-pub_date').values_list(
+            'pk', flat=True)[:200])
+        users = list(User.objects.order_by('pk')[:max(self.writers, 1)])
+        if not posts or len(users) < self.writers:
+            raise ValueError('Нужны посты и пользователи: seed_yatube')
+        return posts, users
+
+    def reader(self, posts, deadline, stats):
+        client = Client(REMOTE_ADDR='10.0.0.1')
+        choice = random.Random()
+        urls = [reverse('posts:api_posts')] + [
+            reverse('posts:post_detail', kwargs={'post_id': post_id})
+            for post_id in posts]
+        while time.monotonic() < deadline:
+            self.timed(stats, lambda: client.get(choice.choice(urls)), 200)
+
+    def writer(self, posts, user, deadline, stats):
+        client = Client(REMOTE_ADDR='10.0.0.1')
+        client.force_login(user)
+        choice = random.Random()
+        while time.monotonic() < deadline:
+            url = reverse('posts:add_comment',
+                          kwargs={'post_id': choice.choice(posts)})
+            self.timed(stats, lambda: client.post(
+                url, {'text': 'Комментарий нагрузочного теста'}), 302)
+
+    @staticmethod
+    def timed(stats, request, expected_status):
+        started = time.perf_counter()
+        try:
+            response = request()
+        except OperationalError:
+            stats['errors'] += 1
+            return
+        if response.status_code != expected_status:
+            stats['errors'] += 1
+            return
+        stats['timings'].append((time.perf_counter() - started) * 1000)
+
+    def worker(self, target, *args):
+        try:
+            target(*args)
+        finally:
+            connection.close()
+
+    def run(self, profile='tuned'):
+        posts, users = self.targets()
+        overrides = dict(PLAIN_PROFILE if profile == 'plain' else {})
+        # лог медленных запросов под нагрузкой только мешает замеру
+        overrides.update(PERF_LOG_SAMPLE_RATE=0, PERF_SLOW_REQUEST_MS=None)
+        with override_settings(**overrides):
+            # режим журнала меняется, пока других соединений нет
+            connection.close()
+            connection.ensure_connection()
+            reads = {'timings': [], 'errors': 0}
+            writes = {'timings': [], 'errors': 0}
+            deadline = time.monotonic() + self.duration
+            threads = [
+                threading.Thread(target=self.worker, args=(
+                    self.reader, posts, deadline, reads))
+                for _ in range(self.readers)
+            ] + [
+                threading.Thread(target=self.worker, args=(
+                    self.writer, posts, user, deadline, writes))
+                for user in users[:self.writers]
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            connection.close()
+        return {'reads': self.summary(reads), 'writes': self.summary(writes)}
+
+    def summary(self, stats):
+        timings = stats['timings']
+        return {
+            'per_second': round(len(timings) / self.duration, 1),
+            'p95_ms': round(percentile(timings, 95), 2) if timings else None,
+            'errors': stats['errors'],
+        }
+
+
+def load_baseline(path):
+    """Сохраненные прогоны {режим: отчет}"""
+    try:
+        with open(path, encoding='utf-8') as stream:
+            return json.load(stream)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, report):
+    """Записывает отчет как базовый для его режима (warm или cold)"""
+    baseline = load_baseline(path)
+    baseline[report['mode']] = report
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as stream:
+        json.dump(baseline, stream, ensure_ascii=False, indent=2)
+        stream.write('\n')
+
+
+def compare(report, baseline, tolerance=0.25):
+    """Список регрессий относительно базового прогона того же режима.
+
+    Время сравнивается по p95 с допуском tolerance, число SQL-запросов
+    не зависит от машины и должно совпадать или уменьшиться.
+    """
+    regressions = []
+    for name, result in report['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        if result['queries'] > base['queries']:
+            regressions.append(
+                f'{name}: SQL-запросов {result["queries"]}, '
+                f'было {base["queries"]}')
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f'{name}: p95 {result["p95_ms"]:.1f} мс, '
+                f'было {base["p95_ms"]:.1f} мс')
+    return regressions
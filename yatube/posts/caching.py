@@ -0,0 +1,316 @@
+import hashlib
+import random
+import time
+import uuid
+from functools import wraps
+
+from django.core.cache import cache
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers
+)
+from django.utils.http import http_date
+
+from django.conf import settings as yatube_conf
+
+from core.routers import pinned_to_primary
+
+from .models import Group, User
+
+
+GENERATION_KEY = 'generation:{scope}'
+MODIFIED_KEY = 'modified:{scope}'
+MISSING = object()
+
+
+def generation_key(scope):
+    return GENERATION_KEY.format(scope=scope)
+
+
+def modified_key(scope):
+    return MODIFIED_KEY.format(scope=scope)
+
+
+def new_generation():
+    # Начальное значение из времени, а не 1: после вытеснения ключа
+    # счетчик не повторит старое поколение и не оживит старые записи
+    return time.time_ns()
+
+
+def get_generations(*scopes):
+    """Текущие поколения областей одним запросом к кешу"""
+    keys = [generation_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = {key: new_generation() for key in keys if key not in found}
+    for key, value in missing.items():
+        if not cache.add(key, value, None):
+            missing[key] = cache.get(key, value)
+    found.update(missing)
+    return [found[key] for key in keys]
+
+
+def bump_generations(*scopes):
+    """Делает устаревшими все записи кеша, построенные на этих областях"""
+    scopes = set(scopes)
+    for scope in scopes:
+        key = generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_generation(), None)
+    now = time.time()
+    cache.set_many({modified_key(scope): now for scope in scopes}, None)
+
+
+def get_last_modified(*scopes):
+    """Время последнего изменения областей для заголовка Last-Modified.
+
+    Если время области неизвестно (кеш очищен), считается,
+    что она изменилась сейчас: клиент один раз получит страницу заново.
+    """
+    keys = [modified_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    now = time.time()
+    for key in keys:
+        if key not in found:
+            added = cache.add(key, now, None)
+            found[key] = now if added else cache.get(key, now)
+    return max(found[key] for key in keys)
+
+
+def bump_post_pages(post):
+    """Сбрасывает кеш страниц, на которых показан пост"""
+    group_ids = {post.group_id,
+                 getattr(post, '_initial_group_id', None)} - {None}
+    author_ids = {post.author_id,
+                  getattr(post, '_initial_author_id', None)} - {None}
+    slugs = Group.objects.filter(
+        pk__in=group_ids).values_list('slug', flat=True)
+    usernames = User.objects.filter(
+        pk__in=author_ids).values_list('username', flat=True)
+    bump_generations(
+        'all',
+        f'post:{post.pk}',
+        *(f'group:{slug}' for slug in slugs),
+        *(f'profile:{username}' for username in usernames),
+    )
+
+
+def request_variant(request):
+    """Вариант страницы: гость или конкретный пользователь.
+
+    Шапка и кнопки подписки зависят от пользователя, поэтому
+    авторизованные получают свою копию страницы.
+    """
+    if not request.user.is_authenticated:
+        return 'anon', []
+    return f'user{request.user.pk}', [f'viewer:{request.user.pk}']
+
+
+def query_fingerprint(request):
+    params = sorted(
+        (key, value)
+        for key in request.GET
+        for value in request.GET.getlist(key)
+    )
+    return hashlib.md5(repr(params).encode()).hexdigest()
+
+
+def page_cache_key(request, key_prefix, scopes):
+    variant, variant_scopes = request_variant(request)
+    generations = get_generations(*scopes, *variant_scopes)
+    version = '.'.join(str(generation) for generation in generations)
+    return (f'page:{key_prefix}:{variant}:{version}:'
+            f'{query_fingerprint(request)}')
+
+
+def page_stale_key(request, key_prefix):
+    """Ключ последней версии страницы, не зависящий от поколений"""
+    variant, _ = request_variant(request)
+    path = hashlib.md5(request.path.encode()).hexdigest()
+    return (f'stale:page:{key_prefix}:{variant}:{path}:'
+            f'{query_fingerprint(request)}')
+
+
+def jittered(timeout):
+    """Срок хранения со случайным разбросом CACHE_TTL_JITTER.
+
+    Записи, созданные одновременно, истекают в разное время
+    и не перестраиваются все разом.
+    """
+    if not timeout:
+        return timeout
+    jitter = yatube_conf.CACHE_TTL_JITTER
+    return timeout * random.uniform(1 - jitter, 1 + jitter)
+
+
+def get_or_regenerate(key, stale_key, regenerate, timeout,
+                      cacheable=lambda value: True):
+    """Значение из кеша, которое перестраивает только один запрос.
+
+    Запись хранит срок свежести отдельно от срока жизни в кеше. Когда
+    запись устарела или поколение сменилось, блокировку lock:<key>
+    получает один запрос, он и вызывает regenerate. Остальные сразу
+    получают устаревшее значение (из старой записи или из stale_key).
+    Если старого значения нет совсем, запрос ждет чужую перестройку,
+    пока держится блокировка, но не дольше PAGE_CACHE_WAIT_SECONDS,
+    а затем строит значение сам, не трогая чужую блокировку.
+    """
+    entry = cache.get(key)
+    if entry is not None and entry[0] > time.time():
+        return entry[1]
+    stale = entry[1] if entry is not None else MISSING
+    lock_key = f'lock:{key}'
+    token = uuid.uuid4().hex
+    locked = cache.add(lock_key, token, yatube_conf.PAGE_CACHE_LOCK_SECONDS)
+    if not locked:
+        if stale is MISSING and stale_key:
+            stale = cache.get(stale_key, MISSING)
+        if stale is not MISSING:
+            return stale
+        entry = wait_for_regeneration(key, lock_key)
+        if entry is not None:
+            return entry[1]
+    try:
+        value = regenerate()
+        if cacheable(value):
+            fresh_for = jittered(timeout)
+            stale_for = yatube_conf.PAGE_CACHE_STALE_SECONDS
+            cache.set(key, (time.time() + fresh_for, value),
+                      fresh_for + stale_for)
+            if stale_key:
+                cache.set(stale_key, value, fresh_for + stale_for)
+    finally:
+        # снимаем только свою блокировку: чужую, взятую после
+        # истечения нашей, удалять нельзя
+        if locked and cache.get(lock_key) == token:
+            cache.delete(lock_key)
+    return value
+
+
+def wait_for_regeneration(key, lock_key):
+    """Запись, построенная другим запросом, или None.
+
+    Ожидание заканчивается, как только блокировка снята (запись готова
+    или ее владелец не смог ее построить), и не длится дольше
+    PAGE_CACHE_WAIT_SECONDS.
+    """
+    deadline = time.monotonic() + yatube_conf.PAGE_CACHE_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(0.02)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        if cache.get(lock_key) is None:
+            return None
+    return None
+
+
+def etag_source(request, key):
+    """Строка для ETag: ключ страницы и, для вошедших, ключ сессии.
+
+    Формы на страницах вошедшего пользователя содержат CSRF-токен,
+    который меняется при входе вместе с ключом сессии. Копия из кеша
+    браузера, полученная до повторного входа, не должна получить 304.
+    """
+    if not request.user.is_authenticated:
+        return key
+    return f'{key}:{request.session.session_key}'
+
+
+def conditional_page(request, key, scopes, respond):
+    """Отвечает 304, если у клиента актуальная версия страницы.
+
+    ETag - хеш ключа страницы (в нем поколения областей, вариант
+    пользователя и параметры запроса) и сессии, см. etag_source.
+    Last-Modified - время последнего сброса этих областей, но не
+    раньше входа пользователя. Оба берутся из кеша и сессии, без
+    запросов к базе и без рендера шаблона.
+    """
+    _, variant_scopes = request_variant(request)
+    digest = hashlib.md5(etag_source(request, key).encode()).hexdigest()
+    etag = f'W/"{digest}"'
+    last_modified = get_last_modified(*scopes, *variant_scopes)
+    last_login = getattr(request.user, 'last_login', None)
+    if last_login is not None:
+        last_modified = max(last_modified, last_login.timestamp())
+    last_modified = int(last_modified)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = respond()
+        if response.status_code != 200:
+            return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def condition_by_generation(key_prefix, scopes):
+    """Проверяет ETag/Last-Modified до вызова представления.
+
+    scopes - функция, которая по запросу и аргументам представления
+    возвращает список областей страницы, или None, если проверять
+    нечего (например, объекта нет).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            page_scopes = (scopes(request, *args, **kwargs)
+                           if request.method in ('GET', 'HEAD') else None)
+            if page_scopes is None:
+                return view(request, *args, **kwargs)
+            return conditional_page(
+                request,
+                page_cache_key(request, key_prefix, page_scopes),
+                page_scopes,
+                lambda: view(request, *args, **kwargs),
+            )
+        return wrapper
+    return decorator
+
+
+def cache_page_by_generation(timeout, key_prefix, scopes):
+    """Кеширует GET-ответ представления до смены поколения его областей.
+
+    scopes - функция, которая по запросу и аргументам представления
+    возвращает список областей (например ['all'] или ['group:<slug>']).
+    В ключ входят параметры запроса (?page=, ?q=) и вариант пользователя.
+    Перестройку страницы выполняет один запрос, остальные получают
+    предыдущую версию (см. get_or_regenerate). Клиент с актуальной
+    версией получает 304 (см. conditional_page). Страница строится по
+    основной базе: она попадает в общий кеш под новым поколением,
+    и отстающая реплика оставила бы в нем старые данные для всех.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            page_scopes = scopes(request, *args, **kwargs)
+            key = page_cache_key(request, key_prefix, page_scopes)
+
+            def regenerate():
+                with pinned_to_primary():
+                    return view(request, *args, **kwargs)
+
+            return conditional_page(
+                request, key, page_scopes,
+                lambda: get_or_regenerate(
+                    key,
+                    page_stale_key(request, key_prefix),
+                    regenerate,
+                    timeout,
+                    cacheable=lambda response: (
+                        response.status_code == 200
+                        and not response.streaming
+                        and not response.cookies
+                    ),
+                ),
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,130 @@
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def change_user_stats(user_id, **deltas):
+    """Атомарно меняет счетчики пользователя одним UPDATE.
+
+    Счетчик не опускается ниже нуля, даже если разошелся с данными.
+    """
+    UserStats.objects.filter(user_id=user_id).update(**{
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    })
+
+
+def total_of(model, field, outer='user_id'):
+    """Подзапрос: число строк model, у которых field равно outer"""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef(outer)})
+        .order_by().values(field).annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
+
+
+def recount_follows(user_ids=(), author_ids=()):
+    """Пересчитывает по таблице Follow счетчики подписок пользователей.
+
+    Один UPDATE с подзапросом на поле при любом числе пользователей.
+    Результат не зависит от того, какие из подписок уже были, поэтому
+    годится после bulk_create(ignore_conflicts=True).
+    """
+    if author_ids:
+        UserStats.objects.filter(user_id__in=author_ids).update(
+            followers_count=total_of(Follow, 'author'))
+    if user_ids:
+        UserStats.objects.filter(user_id__in=user_ids).update(
+            following_count=total_of(Follow, 'user'))
+
+
+USER_COUNTERS = {
+    'posts_count': (Post, 'author'),
+    'followers_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+}
+
+
+def chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def missing_user_stats(batch_size):
+    """id пользователей без строки счетчиков, пачками по pk"""
+    last = 0
+    while True:
+        chunk = list(User.objects.filter(
+            stats__isnull=True, pk__gt=last
+        ).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+
+
+def drifted_user_stats(expected, problems):
+    """id пользователей, чьи счетчики расходятся с expected"""
+    drifted = Q()
+    for field in USER_COUNTERS:
+        drifted |= ~Q(**{field: F(f'{field}_expected')})
+    stats = UserStats.objects.annotate(**{
+        f'{field}_expected': value for field, value in expected.items()
+    }).filter(drifted).order_by('user_id').values()
+    user_ids = []
+    for row in stats.iterator():
+        user_ids.append(row['user_id'])
+        for field in USER_COUNTERS:
+            current, actual = row[field], row[f'{field}_expected']
+            if current != actual:
+                problems.append(
+                    f'user {row["user_id"]}: {field} {current} != {actual}')
+    return user_ids
+
+
+def drifted_posts(expected, problems):
+    """id постов, чей счетчик комментариев расходится с expected"""
+    posts = Post.objects.annotate(expected=expected).exclude(
+        comments_count=F('expected')
+    ).order_by('pk').values_list('pk', 'comments_count', 'expected')
+    post_ids = []
+    for post_id, current, actual in posts.iterator():
+        post_ids.append(post_id)
+        problems.append(
+            f'post {post_id}: comments_count {current} != {actual}')
+    return post_ids
+
+
+def recount_all(fix=True, batch_size=500):
+    """Сверяет все счетчики с данными и, если fix, исправляет их.
+
+    Ожидаемые значения считаются подзапросами внутри базы, в Python
+    читаются только разошедшиеся строки, исправляются они агрегатными
+    UPDATE пачками по batch_size. Возвращает список строк с описанием
+    найденных расхождений.
+    """
+    problems = []
+    for chunk in missing_user_stats(batch_size):
+        problems.extend(f'user {user_id}: нет счетчиков' for user_id in chunk)
+        if fix:
+            # пропуски ищутся дальше по pk, вставка их не сдвигает
+            UserStats.objects.bulk_create(
+                [UserStats(user_id=user_id) for user_id in chunk],
+                ignore_conflicts=True)
+    expected = {field: total_of(model, outer)
+                for field, (model, outer) in USER_COUNTERS.items()}
+    user_ids = drifted_user_stats(expected, problems)
+    comments = total_of(Comment, 'post', 'pk')
+    post_ids = drifted_posts(comments, problems)
+    if fix:
+        for chunk in chunks(user_ids, batch_size):
+            UserStats.objects.filter(user_id__in=chunk).update(**expected)
+        for chunk in chunks(post_ids, batch_size):
+            Post.objects.filter(pk__in=chunk).update(comments_count=comments)
+    return problems
+
+
+def change_comments_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=Greatest(F('comments_count') + delta, 0))
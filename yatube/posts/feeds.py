@@ -0,0 +1,124 @@
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db.models import OuterRef, Q, Subquery
+
+from django.conf import settings as yatube_conf
+
+from .models import FeedEntry, Follow, Post, UserStats
+
+
+def is_pulled_author(author_id):
+    """Посты популярных авторов не раскладываются по лентам при записи,
+    а подмешиваются в ленту при чтении"""
+    return UserStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=yatube_conf.FEED_FANOUT_MAX_FOLLOWERS,
+    ).exists()
+
+
+def fan_out_post(post, batch_size=1000):
+    """Добавляет новый пост в ленты всех подписчиков автора"""
+    if is_pulled_author(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers.iterator()),
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+
+
+def move_post(post):
+    """Переносит пост сменившего автора из лент подписчиков прежнего
+    автора в ленты подписчиков нового"""
+    FeedEntry.objects.filter(post=post).delete()
+    fan_out_post(post)
+
+
+def pairs_filter(pairs, user='user_id', author='author_id'):
+    """Условие на пары (читатель, автор): по одному IN на читателя"""
+    authors = defaultdict(set)
+    for user_id, author_id in pairs:
+        authors[user_id].add(author_id)
+    return reduce(or_, (
+        Q(**{user: user_id, f'{author}__in': author_ids})
+        for user_id, author_ids in authors.items()
+    ))
+
+
+def backfill_feeds(pairs):
+    """Заполняет ленты последними постами авторов после подписок.
+
+    Последние FEED_BACKFILL_POSTS постов каждого автора выбираются
+    одним запросом (коррелированный подзапрос по индексу
+    (author, -pub_date)) и вставляются одним bulk_create.
+    """
+    followers = defaultdict(list)
+    for user_id, author_id in pairs:
+        followers[author_id].append(user_id)
+    latest = Post.objects.filter(
+        author_id=OuterRef('author_id')
+    ).order_by('-pub_date').values('pk')[:yatube_conf.FEED_BACKFILL_POSTS]
+    posts = Post.objects.filter(
+        author_id__in=followers,
+        pk__in=Subquery(latest),
+        author__stats__followers_count__lte=(
+            yatube_conf.FEED_FANOUT_MAX_FOLLOWERS),
+    ).values_list('pk', 'author_id', 'pub_date')
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, author_id, pub_date in posts
+         for user_id in followers[author_id]],
+        ignore_conflicts=True,
+    )
+
+
+def pulled_authors(author_ids):
+    """Авторы из author_ids, чьи посты подмешиваются при чтении"""
+    return set(UserStats.objects.filter(
+        user_id__in=author_ids,
+        followers_count__gt=yatube_conf.FEED_FANOUT_MAX_FOLLOWERS,
+    ).values_list('user_id', flat=True))
+
+
+def resume_fan_out(author_ids):
+    """Возвращает авторов из author_ids, у которых подписчиков стало
+    не больше порога, к раскладке постов по лентам.
+
+    Пока их посты подмешивались при чтении, в ленты они не попадали:
+    последние FEED_BACKFILL_POSTS постов добавляются всем подписчикам.
+    """
+    pushed = set(author_ids) - pulled_authors(author_ids)
+    if pushed:
+        backfill_feeds(Follow.objects.filter(
+            author_id__in=pushed).values_list('user_id', 'author_id'))
+
+
+def trim_feeds(pairs):
+    """Убирает из лент посты авторов после отписок одним DELETE"""
+    FeedEntry.objects.filter(
+        pairs_filter(pairs, author='post__author_id')).delete()
+
+
+def follow_feed(user):
+    """Посты ленты подписок пользователя.
+
+    Обычно это чтение диапазона по индексу (user, -pub_date) таблицы
+    FeedEntry. Посты популярных авторов добавляются чтением из Post.
+    """
+    pulled = list(Follow.objects.filter(
+        user=user,
+        author__stats__followers_count__gt=(
+            yatube_conf.FEED_FANOUT_MAX_FOLLOWERS),
+    ).values_list('author_id', flat=True))
+    if not pulled:
+        return Post.objects.filter(feed_entries__user=user).order_by(
+            '-feed_entries__pub_date', '-id')
+    entries = FeedEntry.objects.filter(user=user).values('post_id')
+    return Post.objects.filter(
+        Q(pk__in=entries) | Q(author_id__in=pulled)
+    ).order_by('-pub_date', '-id')
@@ -0,0 +1,103 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from .caching import bump_generations
+from .counters import recount_follows
+from .feeds import (
+    backfill_feeds, pairs_filter, pulled_authors, resume_fan_out, trim_feeds
+)
+from .models import Follow, User
+from .utils import invalidate_post_counts
+
+_state = threading.local()
+
+
+def resolve_users(usernames):
+    """{имя: id} для существующих пользователей одним запросом"""
+    return dict(User.objects.filter(
+        username__in=set(usernames)).values_list('username', 'pk'))
+
+
+@contextmanager
+def deferred_bookkeeping():
+    """Внутри блока сигналы Follow не обновляют счетчики, ленты и кеш:
+    это делает один вызов follows_changed для всех подписок сразу"""
+    previous = getattr(_state, 'deferred', False)
+    _state.deferred = True
+    try:
+        yield
+    finally:
+        _state.deferred = previous
+
+
+def bookkeeping_deferred():
+    return getattr(_state, 'deferred', False)
+
+
+def follows_changed(pairs, added):
+    """Счетчики, ленты подписок и кеш страниц после подписок (added)
+    или отписок по парам (id читателя, id автора).
+
+    Вызывается и сигналами Follow для одной пары, и массовыми
+    add_follows/remove_follows. Счетчики пересчитываются по таблице,
+    поэтому не важно, какие из подписок уже были.
+    """
+    user_ids = {user_id for user_id, _ in pairs}
+    author_ids = {author_id for _, author_id in pairs}
+    pulled = set() if added else pulled_authors(author_ids)
+    recount_follows(user_ids, author_ids)
+    if added:
+        backfill_feeds(pairs)
+    else:
+        trim_feeds(pairs)
+        if pulled:
+            resume_fan_out(pulled)
+    usernames = User.objects.filter(
+        pk__in=user_ids | author_ids).values_list('username', flat=True)
+    invalidate_post_counts(*(f'follow:{user_id}' for user_id in user_ids))
+    bump_generations(
+        *(f'viewer:{user_id}' for user_id in user_ids),
+        *(f'profile:{username}' for username in usernames),
+    )
+
+
+def add_follows(pairs):
+    """Подписывает по парам (id читателя, id автора).
+
+    Число запросов не зависит от числа пар: одна вставка с пропуском
+    существующих подписок (ограничение unique subscription вместо
+    проверки exists()), пересчет счетчиков и дополнение лент.
+    Сигналы post_save при bulk_create не отправляются, поэтому
+    follows_changed вызывается один раз для всех пар. Возвращает
+    множество пар без подписок на себя.
+    """
+    pairs = {(user_id, author_id) for user_id, author_id in pairs
+             if user_id != author_id}
+    if not pairs:
+        return pairs
+    with transaction.atomic():
+        Follow.objects.bulk_create(
+            [Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in pairs],
+            ignore_conflicts=True,
+        )
+        follows_changed(pairs, added=True)
+    return pairs
+
+
+def remove_follows(pairs):
+    """Отписывает по парам (id читателя, id автора).
+
+    Подписки удаляются одним delete(), сигналы post_delete на время
+    удаления не ведут учет, его для всех пар делает follows_changed.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return pairs
+    with transaction.atomic():
+        with deferred_bookkeeping():
+            Follow.objects.filter(pairs_filter(pairs)).delete()
+        follows_changed(pairs, added=False)
+    return pairs
@@ -0,0 +1,168 @@
+import os
+from io import BytesIO
+
+from django import forms
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+from django.conf import settings as yatube_conf
+
+
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+
+def enabled_variants():
+    """Форматы вариантов, которые умеет сохранять установленный Pillow"""
+    Image.init()
+    return [variant for variant in yatube_conf.POST_IMAGE_VARIANTS
+            if variant.upper() in Image.SAVE]
+
+
+def variant_name(name, variant):
+    return f'{os.path.splitext(name)[0]}.{variant}'
+
+
+class ProcessedImage(SimpleUploadedFile):
+    """Обработанная картинка поста вместе с размерами и вариантами"""
+    processed = True
+
+    def __init__(self, name, content, content_type, width, height,
+                 variants=None):
+        super().__init__(name, content, content_type)
+        self.width = width
+        self.height = height
+        self.variants = variants or {}
+
+
+def encode(image, image_format, **options):
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def open_checked_image(upload):
+    """Открывает загрузку, проверяя размер файла, формат и разрешение"""
+    if upload.size > yatube_conf.POST_IMAGE_MAX_BYTES:
+        raise forms.ValidationError(
+            'Картинка больше %(limit)s МБ',
+            params={'limit': yatube_conf.POST_IMAGE_MAX_BYTES // 2 ** 20},
+        )
+    upload.seek(0)
+    try:
+        image = Image.open(upload)
+    except Image.DecompressionBombError:
+        raise forms.ValidationError('Слишком большое разрешение картинки')
+    except (OSError, SyntaxError):
+        raise forms.ValidationError('Файл не является картинкой')
+    if image.format not in ALLOWED_FORMATS:
+        raise forms.ValidationError(
+            'Поддерживаются только JPEG, PNG, GIF и WebP')
+    if image.width * image.height > yatube_conf.POST_IMAGE_MAX_PIXELS:
+        raise forms.ValidationError('Слишком большое разрешение картинки')
+    return image
+
+
+def reencode(image, image_format):
+    """Сохраняет картинку в ее формате без метаданных"""
+    quality = yatube_conf.POST_IMAGE_QUALITY
+    if image_format == 'JPEG':
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        return encode(image, 'JPEG', quality=quality,
+                      optimize=True, progressive=True)
+    if image_format == 'PNG':
+        return encode(image, 'PNG', optimize=True)
+    return encode(image, image_format, quality=quality)
+
+
+def process_post_image(upload):
+    """Проверяет и готовит загруженную картинку к хранению.
+
+    Отклоняет слишком тяжелые и слишком большие картинки, поворачивает
+    по EXIF, уменьшает до POST_IMAGE_MAX_EDGE, перекодирует без
+    метаданных и готовит сжатые варианты (WebP/AVIF).
+    GIF сохраняется как есть, чтобы не потерять анимацию.
+    Файл, который Pillow не может декодировать (обрезанный, с
+    неподдерживаемым режимом), отклоняется ошибкой формы.
+    """
+    image = open_checked_image(upload)
+    try:
+        return transform(upload, image)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise forms.ValidationError('Не удалось прочитать картинку')
+
+
+def transform(upload, image):
+    # load() декодирует файл сразу, чтобы ошибки не всплыли при записи
+    image.load()
+    image_format = image.format
+    if image_format == 'GIF':
+        # загрузка уходит в хранилище как есть, без копии в памяти
+        upload.seek(0)
+        upload.width, upload.height = image.width, image.height
+        upload.variants = {}
+        upload.processed = True
+        return upload
+
+    image = ImageOps.exif_transpose(image)
+    max_edge = yatube_conf.POST_IMAGE_MAX_EDGE
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    variants = {
+        variant: encode(image, variant.upper(),
+                        quality=yatube_conf.POST_IMAGE_QUALITY)
+        for variant in enabled_variants()
+        if variant != image_format.lower()
+    }
+    return ProcessedImage(upload.name, reencode(image, image_format),
+                          Image.MIME[image_format],
+                          image.width, image.height, variants)
+
+
+def store_image(post):
+    """Записывает новую картинку поста и ее варианты в хранилище.
+
+    Вызывается до транзакции сохранения поста, чтобы запись файлов
+    не шла под блокировкой записи базы. Возвращает True, если файл
+    записан; уже сохраненная картинка не трогается.
+    """
+    image = post.image
+    if not image or image._committed:
+        return False
+    upload = image.file
+    variants = {}
+    if getattr(upload, 'processed', False):
+        post.image_width, post.image_height = upload.width, upload.height
+        variants = upload.variants
+    image.save(upload.name, upload, save=False)
+    save_variants(post.image, variants)
+    return True
+
+
+def save_variants(image, variants):
+    """Записывает варианты рядом с сохраненной картинкой"""
+    storage = image.storage
+    for variant, data in variants.items():
+        path = variant_name(image.name, variant)
+        if hasattr(storage, 'save_derived'):
+            storage.save_derived(path, ContentFile(data))
+            continue
+        if storage.exists(path):
+            storage.delete(path)
+        storage.save(path, ContentFile(data))
+
+
+def variant_urls(image, width):
+    """Ссылки на варианты картинки: {'webp': url, ...}.
+
+    Варианты есть только у обработанных картинок, у таких постов
+    записана ширина, поэтому файлы при проверке не открываются.
+    """
+    if not image or not width:
+        return {}
+    return {
+        variant: image.storage.url(variant_name(image.name, variant))
+        for variant in enabled_variants()
+        if variant_name(image.name, variant) != image.name
+    }
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.benchmark import ConcurrencyBenchmark
+
+
+class Command(BaseCommand):
+    help = ('Одновременные чтения и записи через тестовый клиент. '
+            'Сравнивает настроенный профиль SQLite (WAL, повтор записи) '
+            'с настройками по умолчанию.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8,
+                            help='Потоков чтения')
+        parser.add_argument('--writers', type=int, default=2,
+                            help='Потоков записи')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Длительность каждого прогона (в секундах)')
+        parser.add_argument('--profile', choices=('tuned', 'plain', 'both'),
+                            default='both')
+
+    def handle(self, *args, **options):
+        benchmark = ConcurrencyBenchmark(readers=options['readers'],
+                                         writers=options['writers'],
+                                         duration=options['duration'])
+        profiles = (('plain', 'tuned') if options['profile'] == 'both'
+                    else (options['profile'],))
+        self.stdout.write(f'{"профиль":<8}{"операция":<10}'
+                          f'{"в секунду":>12}{"p95_ms":>10}{"ошибок":>8}')
+        for profile in profiles:
+            try:
+                result = benchmark.run(profile)
+            except ValueError as exc:
+                raise CommandError(exc)
+            for kind in ('reads', 'writes'):
+                row = result[kind]
+                self.stdout.write(
+                    f'{profile:<8}{kind:<10}{row["per_second"]:>12}'
+                    f'{str(row["p95_ms"]):>10}{row["errors"]:>8}')
@@ -0,0 +1,74 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django.conf import settings as yatube_conf
+
+from posts.benchmark import (
+    PERCENTILES, Benchmark, compare, load_baseline, save_baseline
+)
+
+
+class Command(BaseCommand):
+    help = ('Замеряет ленты, профиль, пост, подписки и поиск через '
+            'тестовый клиент: p50/p95/p99, SQL-запросы и пиковую память. '
+            'Сравнивает результат с сохраненным базовым прогоном.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Замеряемых запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Запросов для прогрева перед замером')
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кеш перед каждым запросом')
+        parser.add_argument('--only', nargs='+',
+                            help='Запустить только эти сценарии')
+        parser.add_argument('--baseline',
+                            default=yatube_conf.BENCHMARK_BASELINE,
+                            help='Файл базового прогона')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Записать результат как базовый')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Допустимый рост p95 относительно базы')
+        parser.add_argument('--json', action='store_true',
+                            help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        benchmark = Benchmark(requests=options['requests'],
+                              warmup=options['warmup'],
+                              cold=options['cold'])
+        try:
+            report = benchmark.report(benchmark.run(options['only']))
+        except ValueError as exc:
+            raise CommandError(exc)
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False,
+                                         indent=2))
+        else:
+            self.write_table(report)
+        if options['save_baseline']:
+            save_baseline(options['baseline'], report)
+            self.stdout.write(self.style.SUCCESS(
+                f'Базовый прогон сохранен в {options["baseline"]}'))
+            return
+        baseline = load_baseline(options['baseline']).get(report['mode'])
+        if baseline is None:
+            self.stdout.write(self.style.WARNING(
+                'Базового прогона нет, сравнение пропущено'))
+            return
+        regressions = compare(report, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def write_table(self, report):
+        columns = [f'p{percent}_ms' for percent in PERCENTILES]
+        columns += ['queries', 'peak_kib']
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{report["mode"]}, {report["requests"]} запросов, '
+            f'постов в базе: {report["posts"]}'))
+        self.stdout.write(f'{"сценарий":<22}' + ''.join(
+            f'{column:>11}' for column in columns))
+        for name, result in report['results'].items():
+            self.stdout.write(f'{name:<22}' + ''.join(
+                f'{result[column]:>11}' for column in columns))
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django.conf import settings as yatube_conf
+
+from posts.feeds import follow_feed
+from posts.models import Comment, Follow, Group, Post, User
+from posts.threads import subtrees, with_reply_bounds
+
+
+class Command(BaseCommand):
+    help = ('Показывает планы и время горячих запросов лент. '
+            'Запускать на заполненной базе до и после миграций индексов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Сколько раз выполнить каждый запрос')
+
+    def hot_queries(self):
+        post = Post.objects.order_by('-comments_count').first()
+        group = Group.objects.first()
+        follow = Follow.objects.first()
+        if post is None or group is None or follow is None:
+            raise CommandError('Нужны посты, группы и подписки: seed_yatube')
+        per_page = yatube_conf.COUNT_POSTS_IN_PAGE
+        deep = per_page * 100
+        feeds = Post.objects.select_related('author', 'group')
+        replies = yatube_conf.COMMENT_REPLIES_PER_THREAD
+        roots = with_reply_bounds(Comment.objects.filter(
+            post=post, thread__isnull=True), replies).order_by('-created')[
+            :yatube_conf.COMMENTS_PER_PAGE]
+        bounds = {root.pk: (root.more_path, root.more_id)
+                  for root in roots if root.more_id is not None}
+        root_ids = [root.pk for root in roots]
+        return {
+            'index': feeds.all()[:per_page],
+            'index, страница 100': feeds.all()[deep:deep + per_page],
+            'keyset (pub_date, id)': feeds.order_by(
+                '-pub_date', '-id').filter(pub_date__lt=post.pub_date)[
+                :per_page],
+            'group': feeds.filter(group=group)[:per_page],
+            'profile': feeds.filter(author_id=post.author_id)[:per_page],
+            'comment roots': roots,
+            'comment threads': subtrees(root_ids, bounds),
+            'comment replies': Comment.objects.filter(
+                thread_id=root_ids[0] if root_ids else None
+            ).order_by('path', 'id')[:replies + 1],
+            'follow check': Follow.objects.filter(
+                author_id=follow.author_id, user_id=follow.user_id),
+            'followers of author': Follow.objects.filter(
+                author_id=follow.author_id).values('user_id'),
+            'follow feed': follow_feed(
+                User(pk=follow.user_id))[:per_page],
+        }
+
+    def handle(self, *args, **options):
+        for name, queryset in self.hot_queries().items():
+            plan = queryset.explain()
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                list(queryset._chain())
+            elapsed = (time.perf_counter() - started) / options['repeat']
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{name}: {elapsed * 1000:.2f} мс'))
+            self.stdout.write(plan)
@@ -0,0 +1,44 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.transfer import (
+    MODELS, export_media, export_records, write_csv, write_jsonl
+)
+
+
+class Command(BaseCommand):
+    help = ('Выгружает группы, посты, комментарии и подписки в JSON Lines '
+            'или CSV потоком, не загружая таблицы в память.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output',
+            help='Файл .jsonl (- для stdout) или каталог для CSV')
+        parser.add_argument('--format', choices=('jsonl', 'csv'),
+                            default='jsonl')
+        parser.add_argument('--models', nargs='+', choices=MODELS,
+                            default=MODELS,
+                            help='Какие модели выгружать')
+        parser.add_argument('--media',
+                            help='Каталог, куда скопировать картинки постов')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Строк на одно чтение из базы')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        records = export_records(options['models'], options['chunk_size'])
+        if options['format'] == 'csv':
+            count = write_csv(options['output'], records)
+        elif options['output'] == '-':
+            count = write_jsonl(sys.stdout, records)
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                count = write_jsonl(stream, records)
+        if options['media']:
+            copied = export_media(options['media'], options['chunk_size'])
+            self.stderr.write(f'Скопировано картинок: {copied}')
+        elapsed = time.monotonic() - started
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено записей: {count} за {elapsed:.1f} с'))
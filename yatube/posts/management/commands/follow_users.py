@@ -0,0 +1,67 @@
+import csv
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.follows import add_follows, remove_follows, resolve_users
+
+
+class Command(BaseCommand):
+    help = ('Подписывает (с --unfollow - отписывает) пользователя на '
+            'авторов или загружает граф подписок из CSV. Каждая пачка '
+            'пар занимает постоянное число запросов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', nargs='?',
+                            help='Имя читателя')
+        parser.add_argument('authors', nargs='*',
+                            help='Имена авторов')
+        parser.add_argument('--graph',
+                            help='CSV с колонками user,author, как '
+                                 'follow.csv из export_posts --format csv')
+        parser.add_argument('--unfollow', action='store_true',
+                            help='Удалить подписки вместо создания')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Пар в одной пачке')
+
+    def read_pairs(self, options):
+        if options['graph']:
+            if options['user']:
+                raise CommandError('Нужен либо --graph, либо имена')
+            path = options['graph']
+            with open(path, newline='', encoding='utf-8') as stream:
+                for record in csv.DictReader(stream):
+                    yield record['user'], record['author']
+        elif options['user'] and options['authors']:
+            for author in options['authors']:
+                yield options['user'], author
+        else:
+            raise CommandError('Укажите читателя и авторов или --graph')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        change = remove_follows if options['unfollow'] else add_follows
+        pairs = self.read_pairs(options)
+        changed = unknown = 0
+        try:
+            while True:
+                batch = list(islice(pairs, options['batch_size']))
+                if not batch:
+                    break
+                users = resolve_users(
+                    name for pair in batch for name in pair)
+                known = [(users[user], users[author])
+                         for user, author in batch
+                         if user in users and author in users]
+                unknown += len(batch) - len(known)
+                changed += len(change(known))
+        except KeyError as exc:
+            raise CommandError(f'В CSV нет колонки {exc}')
+        elapsed = time.monotonic() - started
+        if unknown:
+            self.stdout.write(self.style.WARNING(
+                f'Пропущено пар с неизвестными именами: {unknown}'))
+        action = 'Отписок' if options['unfollow'] else 'Подписок'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} обработано: {changed} за {elapsed:.1f} с'))
@@ -0,0 +1,57 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from posts.transfer import Importer, read_csv, read_jsonl
+
+
+class Command(BaseCommand):
+    help = ('Загружает выгрузку export_posts пачками через bulk_create. '
+            'В заполненную базу посты и комментарии попадают с новыми id.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input',
+            help='Файл .jsonl (- для stdin) или каталог с CSV')
+        parser.add_argument('--format', choices=('jsonl', 'csv'),
+                            default='jsonl')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Строк в одной транзакции bulk_create')
+        parser.add_argument('--create-users', action='store_true',
+                            help='Создавать отсутствующих пользователей '
+                                 'без пароля')
+        parser.add_argument('--media',
+                            help='Каталог с картинками из export_posts')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        importer = Importer(batch_size=options['batch_size'],
+                            create_users=options['create_users'],
+                            media=options['media'])
+        try:
+            if options['format'] == 'csv':
+                counts = importer.run(read_csv(options['input']))
+            elif options['input'] == '-':
+                counts = importer.run(read_jsonl(sys.stdin))
+            else:
+                with open(options['input'], encoding='utf-8') as stream:
+                    counts = importer.run(read_jsonl(stream))
+        except (ValueError, KeyError) as exc:
+            raise CommandError(f'Ошибка в выгрузке: {exc!r}')
+        except IntegrityError as exc:
+            # id заняты строками, записанными во время загрузки
+            raise CommandError(f'Конфликт с данными в базе: {exc}')
+        elapsed = time.monotonic() - started
+        for name, count in counts.items():
+            self.stdout.write(f'{name}: {count}')
+        if importer.skipped:
+            self.stdout.write(self.style.WARNING(
+                f'Пропущено записей без пользователя: {importer.skipped}'))
+        if importer.orphans:
+            self.stdout.write(self.style.WARNING(
+                f'Пропущено комментариев к отсутствующим постам: '
+                f'{importer.orphans}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено за {elapsed:.1f} с'))
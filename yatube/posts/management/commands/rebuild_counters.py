@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.counters import recount_all
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счетчики постов, комментариев и подписок. '
+            'С --check только проверяет их.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить счетчики, ничего не исправляя',
+        )
+
+    def handle(self, *args, **options):
+        problems = recount_all(fix=not options['check'])
+        for problem in problems:
+            self.stdout.write(problem)
+        if options['check'] and problems:
+            raise CommandError(
+                f'Найдено расхождений в счетчиках: {len(problems)}')
+        if problems:
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено расхождений: {len(problems)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Счетчики в порядке'))
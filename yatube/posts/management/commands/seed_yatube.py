@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.seeding import SEED_PASSWORD, Seeder
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами, комментариями и подписками для замеров '
+            'производительности.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument('--comments', type=int, default=10000)
+        parser.add_argument('--follows', type=int, default=2000)
+        parser.add_argument('--replies', type=float, default=0.3,
+                            help='Доля комментариев-ответов')
+        parser.add_argument('--images', type=float, default=0.05,
+                            help='Доля постов с картинкой')
+        parser.add_argument('--exponent', type=float, default=1.1,
+                            help='Показатель степенного закона активности')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней распределить посты')
+        parser.add_argument('--prefix', default='seed',
+                            help='Префикс имен пользователей и групп')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Зерно генератора случайных чисел')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        seeder = Seeder(
+            users=options['users'], groups=options['groups'],
+            posts=options['posts'], comments=options['comments'],
+            follows=options['follows'], replies=options['replies'],
+            images=options['images'],
+            exponent=options['exponent'], days=options['days'],
+            prefix=options['prefix'], seed=options['seed'],
+            batch_size=options['batch_size'],
+        )
+        for name, count in seeder.run().items():
+            self.stdout.write(f'{name}: {count}')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'База заполнена за {elapsed:.1f} с, '
+            f'пароль пользователей: {SEED_PASSWORD}'))
@@ -0,0 +1,82 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:59
+
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+# FEED_BACKFILL_POSTS и FEED_FANOUT_MAX_FOLLOWERS на момент миграции
+BACKFILL_POSTS = 500
+FANOUT_MAX_FOLLOWERS = 5000
+BATCH_SIZE = 1000
+
+
+def fill_feeds(apps, schema_editor):
+    """Раскладывает последние посты авторов по лентам подписчиков.
+
+    Посты авторов с числом подписчиков больше порога, как и при записи,
+    в ленты не попадают. Запросов два: подписки и последние посты всех
+    авторов (коррелированный подзапрос), вставка - пачками.
+    """
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('posts', 'Follow')
+    FeedEntry = apps.get_model('posts', 'FeedEntry')
+    followers = defaultdict(list)
+    for user_id, author_id in Follow.objects.values_list(
+            'user_id', 'author_id').iterator():
+        followers[author_id].append(user_id)
+    pushed = [author_id for author_id, user_ids in followers.items()
+              if len(user_ids) <= FANOUT_MAX_FOLLOWERS]
+    latest = Post.objects.filter(
+        author_id=OuterRef('author_id')
+    ).order_by('-pub_date').values('pk')[:BACKFILL_POSTS]
+    posts = Post.objects.filter(
+        author_id__in=pushed, pk__in=Subquery(latest),
+    ).values_list('pk', 'author_id', 'pub_date')
+    entries = (
+        FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, author_id, pub_date in list(posts)
+        for user_id in followers[author_id]
+    )
+    while True:
+        batch = list(islice(entries, BATCH_SIZE))
+        if not batch:
+            break
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0021_post_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации поста')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='posts.Post', verbose_name='Пост')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='Читатель ленты')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date'], name='feed_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique feed entry'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
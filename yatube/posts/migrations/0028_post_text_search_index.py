@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+INDEX = 'posts_post_text_tsv'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # то же выражение, что строит SearchVector('text', config='russian')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX} ON posts_post USING GIN '
+        "(to_tsvector('russian'::regconfig, COALESCE(text, '')))"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0027_comment_thread_path_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .storage import post_image_storage
 from .validators import min_size, size_comment
 
 
@@ -57,11 +58,38 @@ class Post(models.Model):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
+        storage=post_image_storage,
         blank=True
     )
+    image_width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Ширина картинки'
+    )
+    image_height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Высота картинки'
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество комментариев',
+        help_text='Поддерживается сигналами, пересчет: rebuild_counters'
+    )
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['author', '-pub_date'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date'],
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_id_idx'),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
@@ -96,15 +124,68 @@ class Comment(models.Model):
         verbose_name='Время комментария',
         help_text='Завполняется автоматически'
     )
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='replies',
+        verbose_name='Ответ на комментарий'
+    )
+    thread = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Первый комментарий ветки',
+        help_text='Пусто у комментариев верхнего уровня'
+    )
+    path = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Путь в дереве',
+        help_text='id всех предков по PATH_SEGMENT цифр, от корня ветки'
+    )
+
+    PATH_SEGMENT = 10
 
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(fields=['post', '-created'],
+                         name='comment_post_created_idx'),
+            models.Index(fields=['post', 'thread', '-created'],
+                         name='comment_post_roots_idx'),
+            models.Index(fields=['thread', 'path', 'id'],
+                         name='comment_thread_path_idx'),
+        ]
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
     def __str__(self) -> str:
         return f'{self.author}: {self.text[:15]}'
 
+    @property
+    def depth(self):
+        return len(self.path) // self.PATH_SEGMENT
+
+    def reply_to(self, parent, max_depth):
+        """Делает комментарий ответом на parent.
+
+        Ответ глубже max_depth становится соседом parent, а не его
+        потомком: родитель и его путь берутся из пути parent без запроса.
+        """
+        parent_id, path = parent.pk, parent.path
+        if parent.depth >= max_depth:
+            parent_id = int(path[-self.PATH_SEGMENT:])
+            path = path[:-self.PATH_SEGMENT]
+        self.parent_id = parent_id
+        self.thread_id = parent.thread_id or parent.pk
+        self.path = path + f'{parent_id:0{self.PATH_SEGMENT}d}'
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -126,6 +207,94 @@ class Follow(models.Model):
                                     name='unique subscription'
                                     )
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'{self.user} to: {self.author}'
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество постов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписок'
+    )
+
+    class Meta:
+        verbose_name = 'Счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+    def __str__(self) -> str:
+        return f'{self.user}: {self.posts_count} постов'
+
+
+class FeedEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Читатель ленты'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пост'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации поста'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique feed entry'
+                                    )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date'],
+                         name='feed_user_pub_date_idx'),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+
+    def __str__(self) -> str:
+        return f'{self.user}: {self.post_id}'
+
+
+class StoredFile(models.Model):
+    """Файл в адресуемом по содержимому хранилище и число ссылок на него"""
+    name = models.CharField(
+        max_length=255,
+        primary_key=True,
+        verbose_name='Имя файла в хранилище'
+    )
+    refs = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество ссылок'
+    )
+
+    class Meta:
+        verbose_name = 'Файл хранилища'
+        verbose_name_plural = 'Файлы хранилища'
+
+    def __str__(self) -> str:
+        return f'{self.name}: {self.refs}'
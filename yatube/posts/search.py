@@ -0,0 +1,130 @@
+import re
+from functools import lru_cache
+
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from django.conf import settings as yatube_conf
+
+
+FTS_TABLE = 'posts_post_fts'
+WORD_RE = re.compile(r'\w+')
+
+
+def search_terms(query):
+    """Разбивает строку поиска на слова без служебных символов"""
+    return WORD_RE.findall(query.lower())
+
+
+class BaseSearchBackend:
+    """Интерфейс поиска по постам.
+
+    index/remove вызываются сигналами Post, search получает queryset
+    постов и возвращает найденные посты, отсортированные по релевантности.
+    """
+
+    def index(self, post):
+        pass
+
+    def remove(self, post_id):
+        pass
+
+    def rebuild(self):
+        """Строит индекс заново, например после bulk_create"""
+        pass
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+
+class ContainsSearchBackend(BaseSearchBackend):
+    """Поиск по вхождению подстроки, без индекса"""
+
+    def search(self, queryset, query):
+        return queryset.filter(text__contains=query)
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """Полнотекстовый поиск через виртуальную таблицу SQLite FTS5.
+
+    Таблица создается миграцией, rowid в ней совпадает с id поста.
+    Каждое слово запроса ищется как префикс, все слова обязательны.
+    """
+
+    def index(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+                [post.pk, post.text],
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) '
+                'SELECT id, text FROM posts_post'
+            )
+
+    @staticmethod
+    def match_expression(query):
+        return ' '.join(f'"{term}"*' for term in search_terms(query))
+
+    def search(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.none()
+        post_table = queryset.model._meta.db_table
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {post_table}.id',
+                   f'{FTS_TABLE} MATCH %s'],
+            params=[expression],
+            order_by=[f'{FTS_TABLE}.rank', '-pub_date'],
+        )
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Полнотекстовый поиск PostgreSQL по tsvector.
+
+    Вектор строится выражением, поэтому отдельная синхронизация
+    не нужна. GIN-индекс (миграция 0028) построен по тому самому
+    выражению, которое генерирует SearchVector в Django 2.2, иначе
+    планировщик его не использует:
+    to_tsvector('russian'::regconfig, COALESCE(text, '')).
+    """
+    config = 'russian'
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import (
+            SearchQuery, SearchRank, SearchVector
+        )
+        terms = search_terms(query)
+        if not terms:
+            return queryset.none()
+        vector = SearchVector('text', config=self.config)
+        search_query = SearchQuery(
+            ' & '.join(f'{term}:*' for term in terms),
+            config=self.config,
+            search_type='raw',
+        )
+        return queryset.annotate(
+            search=vector,
+            rank=SearchRank(vector, search_query),
+        ).filter(search=search_query).order_by('-rank', '-pub_date')
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    return import_string(yatube_conf.POSTS_SEARCH_BACKEND)()
+
+
+def search_posts(queryset, query):
+    return get_search_backend().search(queryset, query)
@@ -0,0 +1,261 @@
+import io
+import random
+from collections import defaultdict
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from django.conf import settings as yatube_conf
+
+from .caching import bump_generations
+from .counters import recount_all
+from .images import process_post_image, save_variants
+from .models import Comment, FeedEntry, Follow, Group, Post, User
+from .search import get_search_backend
+from .transfer import keep_dates, sync_references
+from .utils import invalidate_post_counts
+
+# словарь для текстов: по этим словам работает поиск в бенчмарке
+WORDS = (
+    'город', 'утро', 'кофе', 'поезд', 'море', 'книга', 'музыка', 'код',
+    'python', 'django', 'кот', 'собака', 'дождь', 'солнце', 'горы', 'лес',
+    'работа', 'отпуск', 'фото', 'рецепт', 'велосипед', 'театр', 'кино',
+    'новости', 'проект', 'идея', 'вечер', 'друзья', 'семья', 'зима',
+)
+SEED_PASSWORD = 'yatube-seed'
+IMAGE_COLORS = ('#c0392b', '#2980b9', '#27ae60', '#8e44ad')
+# сколько последних комментариев поста помнить как кандидатов в родители
+REPLY_CANDIDATES = 50
+
+
+def power_law_weights(count, exponent):
+    """Накопленные веса закона Ципфа: k-й элемент весит 1 / k^exponent"""
+    return list(accumulate(
+        1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+class Seeder:
+    """Заполняет базу синтетическими данными через bulk_create.
+
+    Активность авторов, популярность постов и число подписчиков
+    распределены по степенному закону: немногие авторы пишут много
+    и собирают большую часть подписок, как в настоящих соцсетях.
+    Генератор случайных чисел задается seed, поэтому данные
+    воспроизводимы. Сигналы при bulk_create не работают, поэтому
+    ленты подписок раскладываются здесь же, а счетчики и поисковый
+    индекс пересчитываются в конце.
+    """
+
+    def __init__(self, users=200, groups=10, posts=5000, comments=10000,
+                 follows=2000, replies=0.3, images=0.05, exponent=1.1,
+                 days=365, prefix='seed', seed=0, batch_size=1000):
+        self.volumes = {'users': users, 'groups': groups, 'posts': posts,
+                        'comments': comments, 'follows': follows}
+        self.reply_ratio = replies
+        self.image_ratio = images
+        self.exponent = exponent
+        self.days = days
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.now = timezone.now()
+
+    def run(self):
+        users = self.create_users()
+        groups = self.create_groups()
+        posts = self.create_posts(users, groups)
+        comments = self.create_comments(users, posts)
+        follows = self.create_follows(users)
+        feed = self.create_feed_entries(follows, posts)
+        self.finish(groups)
+        return {'users': len(users), 'groups': len(groups),
+                'posts': len(posts), 'comments': comments,
+                'follows': len(follows), 'feed entries': feed}
+
+    def bulk_create(self, model, objects):
+        with transaction.atomic():
+            # размер пачки INSERT Django подбирает под лимиты базы
+            model.objects.bulk_create(objects, ignore_conflicts=True)
+
+    def insert(self, model, objects):
+        """Вставляет объекты из итератора пачками по batch_size,
+        не держа в памяти больше одной пачки. Возвращает их число"""
+        objects = iter(objects)
+        count = 0
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                return count
+            self.bulk_create(model, batch)
+            count += len(batch)
+
+    def next_id(self, model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def text(self, low, high):
+        words = self.random.choices(WORDS, k=self.random.randint(low, high))
+        return ' '.join(words).capitalize() + '.'
+
+    def create_users(self):
+        """Список id пользователей, от самого активного к наименее"""
+        start = self.next_id(User)
+        password = make_password(SEED_PASSWORD)
+        usernames = [f'{self.prefix}_user_{start + number}'
+                     for number in range(self.volumes['users'])]
+        self.bulk_create(User, [
+            User(username=username, password=password,
+                 first_name=username.rsplit('_', 1)[-1])
+            for username in usernames
+        ])
+        ids = dict(User.objects.filter(
+            username__in=usernames).values_list('username', 'pk'))
+        return [ids[username] for username in usernames]
+
+    def create_groups(self):
+        start = self.next_id(Group)
+        slugs = [f'{self.prefix}-group-{start + number}'
+                 for number in range(self.volumes['groups'])]
+        self.bulk_create(Group, [
+            Group(title=f'Группа {slug}', slug=slug,
+                  description=self.text(5, 20))
+            for slug in slugs
+        ])
+        return list(Group.objects.filter(
+            slug__in=slugs).values_list('pk', flat=True))
+
+    def create_images(self):
+        """Несколько картинок, общих для постов: хранилище адресуется
+        по содержимому, поэтому одинаковые файлы не дублируются"""
+        images = []
+        for number, color in enumerate(IMAGE_COLORS):
+            data = io.BytesIO()
+            Image.new('RGB', (1280, 960), color).save(data, 'JPEG')
+            upload = process_post_image(SimpleUploadedFile(
+                f'{self.prefix}-{number}.jpg', data.getvalue(),
+                content_type='image/jpeg'))
+            field = Post(image=f'posts/{upload.name}').image
+            field.name = field.storage.save(field.name, upload)
+            save_variants(field, upload.variants)
+            images.append((field.name, upload.width, upload.height))
+        return images
+
+    def create_posts(self, users, groups):
+        """Список (id, id автора, дата) созданных постов"""
+        images = self.create_images() if self.image_ratio else []
+        rows = []
+        with keep_dates(Post._meta.get_field('pub_date')):
+            self.insert(Post, self.generate_posts(users, groups, images, rows))
+        if images:
+            sync_references([name for name, _, _ in images])
+        return rows
+
+    def generate_posts(self, users, groups, images, rows):
+        authors = power_law_weights(len(users), self.exponent)
+        start = self.next_id(Post)
+        for number in range(self.volumes['posts']):
+            author_id = self.random.choices(users, cum_weights=authors)[0]
+            pub_date = self.now - timedelta(
+                seconds=self.random.uniform(0, self.days * 86400))
+            post = Post(
+                id=start + number,
+                text=self.text(5, 60),
+                author_id=author_id,
+                group_id=(self.random.choice(groups)
+                          if groups and self.random.random() < 0.7
+                          else None),
+                pub_date=pub_date,
+            )
+            if images and self.random.random() < self.image_ratio:
+                (post.image, post.image_width,
+                 post.image_height) = self.random.choice(images)
+            rows.append((post.id, author_id, pub_date))
+            yield post
+
+    def create_comments(self, users, posts):
+        if not posts:
+            return 0
+        with keep_dates(Comment._meta.get_field('created')):
+            return self.insert(Comment, self.generate_comments(users, posts))
+
+    def generate_comments(self, users, posts):
+        weights = power_law_weights(len(posts), self.exponent)
+        # популярность поста не зависит от его даты
+        popular = self.random.sample(posts, len(posts))
+        start = self.next_id(Comment)
+        by_post = defaultdict(list)
+        for number in range(self.volumes['comments']):
+            post_id, _, pub_date = self.random.choices(
+                popular, cum_weights=weights)[0]
+            comment = Comment(
+                id=start + number,
+                post_id=post_id,
+                author_id=self.random.choice(users),
+                text=self.text(2, 25),
+            )
+            earlier = by_post[post_id]
+            if earlier and self.random.random() < self.reply_ratio:
+                # отвечают чаще на свежие комментарии
+                parent = earlier[-1 - min(
+                    len(earlier) - 1, int(self.random.expovariate(0.5)))]
+                comment.reply_to(parent, yatube_conf.COMMENT_MAX_DEPTH)
+                pub_date = parent.created
+            comment.created = min(self.now, pub_date + timedelta(
+                minutes=self.random.expovariate(1 / 600)))
+            earlier.append(comment)
+            del earlier[:-REPLY_CANDIDATES]
+            yield comment
+
+    def create_follows(self, users):
+        """Читатель выбирается равномерно, автор - по степенному закону"""
+        if len(users) < 2:
+            return set()
+        weights = power_law_weights(len(users), self.exponent)
+        wanted = min(self.volumes['follows'],
+                     len(users) * (len(users) - 1))
+        follows = set()
+        attempts = wanted * 20
+        while len(follows) < wanted and attempts:
+            attempts -= 1
+            user_id = self.random.choice(users)
+            author_id = self.random.choices(users, cum_weights=weights)[0]
+            if user_id != author_id:
+                follows.add((user_id, author_id))
+        self.bulk_create(Follow, [
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id, author_id in follows
+        ])
+        return follows
+
+    def create_feed_entries(self, follows, posts):
+        """Раскладывает последние посты авторов по лентам подписчиков,
+        как это делают сигналы при обычной публикации"""
+        latest = defaultdict(list)
+        for post_id, author_id, pub_date in sorted(
+                posts, key=lambda row: row[2], reverse=True):
+            if len(latest[author_id]) < yatube_conf.FEED_BACKFILL_POSTS:
+                latest[author_id].append((post_id, pub_date))
+        followers = defaultdict(int)
+        for _, author_id in follows:
+            followers[author_id] += 1
+        entries = (
+            FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for user_id, author_id in follows
+            if followers[author_id] <= yatube_conf.FEED_FANOUT_MAX_FOLLOWERS
+            for post_id, pub_date in latest[author_id]
+        )
+        return self.insert(FeedEntry, entries)
+
+    def finish(self, groups):
+        recount_all(batch_size=self.batch_size)
+        get_search_backend().rebuild()
+        # новые пользователи еще не смотрели свои страницы,
+        # устаревают только общие ленты и группы
+        invalidate_post_counts(
+            'all', *(f'group:{group_id}' for group_id in groups))
+        bump_generations('all', 'groups')
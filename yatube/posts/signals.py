@@ -0,0 +1,165 @@
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_save
+)
+from django.dispatch import receiver
+
+from .caching import bump_generations, bump_post_pages
+from .counters import change_comments_count, change_user_stats
+from .feeds import fan_out_post, move_post
+from .follows import bookkeeping_deferred, follows_changed
+from .images import save_variants
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .search import get_search_backend
+from .thumbnails import schedule_thumbnails
+from .utils import invalidate_post_counts
+
+
+def follower_scopes(author_id):
+    """Области лент подписок всех подписчиков автора"""
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    return [f'follow:{user_id}' for user_id in followers]
+
+
+def reset_post_counts(post):
+    scopes = {'all'}
+    for group_id in (post.group_id, post._initial_group_id):
+        if group_id is not None:
+            scopes.add(f'group:{group_id}')
+    for author_id in {post.author_id, post._initial_author_id}:
+        if author_id is not None:
+            scopes.add(f'author:{author_id}')
+            scopes.update(follower_scopes(author_id))
+    invalidate_post_counts(*scopes)
+
+
+def card_fields(user):
+    return tuple(user.__dict__.get(field)
+                 for field in ('username', 'first_name', 'last_name'))
+
+
+@receiver(post_init, sender=User)
+def remember_user_card(sender, instance, **kwargs):
+    instance._initial_card = card_fields(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+    elif card_fields(instance) != instance._initial_card:
+        # имя автора выводится в карточках его постов и в комментариях,
+        # а область 'groups' входит во все страницы с лентами
+        bump_generations(f'author:{instance.pk}', 'groups')
+    instance._initial_card = card_fields(instance)
+
+
+@receiver(post_init, sender=Post)
+def remember_post_scopes(sender, instance, **kwargs):
+    """Запоминает исходные группу и автора, чтобы сбросить и их счетчики.
+
+    Читает только загруженные поля, чтобы не подгружать отложенные.
+    """
+    instance._initial_group_id = instance.__dict__.get('group_id')
+    instance._initial_author_id = instance.__dict__.get('author_id')
+    instance._initial_image = str(instance.__dict__.get('image') or '')
+
+
+@receiver(pre_save, sender=Post)
+def remember_image_size(sender, instance, **kwargs):
+    """Записывает размеры новой обработанной картинки в пост.
+
+    Картинка сохраняется в хранилище позже, в pre_save поля,
+    а варианты пишутся после сохранения поста.
+    """
+    if 'image' not in instance.__dict__:
+        return
+    image = instance.image
+    if image and not image._committed:
+        # хранилище возьмет на файл новую ссылку (см. post_saved)
+        instance._image_stored = True
+    if not image:
+        instance.image_width = instance.image_height = None
+    elif not image._committed and getattr(image.file, 'processed', False):
+        instance.image_width = image.file.width
+        instance.image_height = image.file.height
+        instance._image_variants = image.file.variants
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    reset_post_counts(instance)
+    bump_post_pages(instance)
+    if created:
+        change_user_stats(instance.author_id, posts_count=1)
+        fan_out_post(instance)
+    elif instance.author_id != instance._initial_author_id:
+        change_user_stats(instance._initial_author_id, posts_count=-1)
+        change_user_stats(instance.author_id, posts_count=1)
+        move_post(instance)
+    instance._initial_group_id = instance.group_id
+    instance._initial_author_id = instance.author_id
+    get_search_backend().index(instance)
+    variants = instance.__dict__.pop('_image_variants', None)
+    if variants:
+        save_variants(instance.image, variants)
+    stored = instance.__dict__.pop('_image_stored', False)
+    if instance.image.name != instance._initial_image:
+        if instance.image:
+            schedule_thumbnails(instance.pk, new_image=True)
+        if instance._initial_image:
+            instance.image.storage.delete(instance._initial_image)
+    elif stored and instance.image:
+        # заново загружены те же байты: имя не изменилось,
+        # а ссылка на файл взята второй раз
+        instance.image.storage.delete(instance.image.name)
+    instance._initial_image = instance.image.name or ''
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    reset_post_counts(instance)
+    bump_post_pages(instance)
+    change_user_stats(instance.author_id, posts_count=-1)
+    get_search_backend().remove(instance.pk)
+    if instance.image:
+        instance.image.storage.delete(instance.image.name)
+
+
+@receiver(post_init, sender=Group)
+def remember_group_slug(sender, instance, **kwargs):
+    instance._initial_slug = instance.__dict__.get('slug')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    bump_generations('groups', f'group:{instance.slug}',
+                     f'group:{instance._initial_slug}')
+    instance._initial_slug = instance.slug
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    bump_generations(f'post:{instance.post_id}')
+    if created:
+        change_comments_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    bump_generations(f'post:{instance.post_id}')
+    change_comments_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created and not bookkeeping_deferred():
+        follows_changed({(instance.user_id, instance.author_id)}, added=True)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    if not bookkeeping_deferred():
+        follows_changed({(instance.user_id, instance.author_id)},
+                        added=False)
@@ -0,0 +1,124 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from core.db import immediate_atomic
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла - хеш его содержимого.
+
+    Одинаковые картинки хранятся один раз под именем
+    <каталог>/<ab>/<cd>/<sha256><расширение>, для каждого файла в
+    StoredFile ведется число ссылок. delete уменьшает счетчик, а файл
+    (и производные от него варианты) удаляется после фиксации транзакции,
+    если к этому моменту ссылок так и не появилось.
+    Файлы, сохраненные до появления хранилища, не учитываются и
+    не удаляются. Содержимое по имени не меняется, поэтому такие URL
+    можно отдавать с бессрочным Cache-Control.
+    """
+    chunk_size = 64 * 2 ** 10
+
+    def digest(self, content):
+        """SHA-256 содержимого, файл читается частями"""
+        sha = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks(self.chunk_size):
+            sha.update(chunk)
+        content.seek(0)
+        return sha.hexdigest()
+
+    def addressed_name(self, name, digest):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, digest[:2], digest[2:4],
+                            digest + extension)
+
+    def _save(self, name, content):
+        # хеш, посчитанный при приеме загрузки, повторно не считается
+        digest = (getattr(content, 'content_digest', None)
+                  or self.digest(content))
+        name = self.addressed_name(name, digest)
+        # ссылка берется до проверки файла: release не удалит файл,
+        # на который уже ссылаются
+        self.add_reference(name)
+        if not self.exists(name):
+            saved = super()._save(name, content)
+            if saved != name:
+                # тот же файл успел записать параллельный запрос
+                super().delete(saved)
+        return name
+
+    def add_reference(self, name):
+        from .models import StoredFile
+
+        updated = StoredFile.objects.filter(name=name).update(
+            refs=F('refs') + 1)
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(name=name, refs=1)
+        except IntegrityError:
+            StoredFile.objects.filter(name=name).update(refs=F('refs') + 1)
+
+    def delete(self, name):
+        """Снимает одну ссылку, файл удаляется после последней"""
+        from .models import StoredFile
+
+        StoredFile.objects.filter(name=name, refs__gt=0).update(
+            refs=F('refs') - 1)
+        if StoredFile.objects.filter(name=name, refs=0).exists():
+            # файл удаляется только если снятие ссылки зафиксировано
+            transaction.on_commit(lambda: self.release(name))
+
+    def release(self, name):
+        """Удаляет файл, если ссылок на него по-прежнему нет.
+
+        Проверка и удаление идут в транзакции, которая сразу берет
+        блокировку записи: в SQLite это BEGIN IMMEDIATE
+        (core.db.immediate_atomic), select_for_update там ничего
+        не делает и блокирует строку только в других базах.
+        Параллельный add_reference либо успевает увеличить счетчик
+        и файл остается, либо ждет удаления и создает строку заново,
+        а _save записывает файл снова.
+        """
+        from .models import StoredFile
+
+        with immediate_atomic():
+            unused = StoredFile.objects.select_for_update().filter(
+                name=name, refs=0).first()
+            if unused is not None:
+                unused.delete()
+                self.remove(name)
+
+    def remove(self, name):
+        self.delete_derived(name)
+        super().delete(name)
+
+    def save_derived(self, name, content):
+        """Сохраняет файл, производный от адресуемого, под заданным именем.
+
+        Варианты картинки однозначно определяются оригиналом, поэтому
+        уже записанный вариант не перезаписывается.
+        """
+        if not self.exists(name):
+            super()._save(name, content)
+        return name
+
+    def delete_derived(self, name):
+        directory, filename = os.path.split(name)
+        stem = os.path.splitext(filename)[0]
+        if not stem or not self.exists(directory):
+            return
+        for sibling in self.listdir(directory)[1]:
+            if sibling != filename and sibling.startswith(stem + '.'):
+                super().delete(os.path.join(directory, sibling))
+
+
+post_image_storage = ContentAddressedStorage()
@@ -0,0 +1,52 @@
+from django import template
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from django.conf import settings as yatube_conf
+
+from ..caching import get_generations, jittered
+
+register = template.Library()
+
+CARD_TEMPLATE = 'posts/includes/print_post.html'
+
+
+def card_scopes(post):
+    return f'post:{post.pk}', f'author:{post.author_id}'
+
+
+@register.simple_tag
+def post_cards(posts, detail_print):
+    """Карточки постов страницы из кеша фрагментов.
+
+    Версии всех карточек и сами карточки читаются двумя get_many,
+    отрисовываются только отсутствующие в кеше. Карточки постов,
+    прочитанных с реплики, в кеш не пишутся: реплика может отставать,
+    а ключ уже содержит новое поколение.
+    """
+    posts = list(posts)
+    scopes = {'groups'}
+    for post in posts:
+        scopes.update(card_scopes(post))
+    scopes = sorted(scopes)
+    generations = dict(zip(scopes, get_generations(*scopes)))
+    keys = []
+    for post in posts:
+        version = '.'.join(
+            str(generations[scope])
+            for scope in (*card_scopes(post), 'groups')
+        )
+        keys.append(f'post_card:{detail_print}:{post.pk}:{version}')
+    cards = cache.get_many(keys)
+    missing = {}
+    for key, post in zip(keys, posts):
+        if key not in cards:
+            cards[key] = render_to_string(
+                CARD_TEMPLATE, {'post': post, 'detail_print': detail_print})
+            if post._state.db == DEFAULT_DB_ALIAS:
+                missing[key] = cards[key]
+    if missing:
+        cache.set_many(missing, jittered(yatube_conf.TIME_CACHE_SECONDS))
+    return [mark_safe(cards[key]) for key in keys]
@@ -0,0 +1,20 @@
+from django import template
+
+from ..images import variant_urls
+from ..thumbnails import ready_thumbnail_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail_url(image, size):
+    """Ссылка на готовую миниатюру или, пока ее нет, на оригинал"""
+    if not image:
+        return ''
+    return ready_thumbnail_url(image, size)
+
+
+@register.simple_tag
+def image_variants(post):
+    """Ссылки на сжатые варианты картинки поста по форматам"""
+    return variant_urls(post.image, post.image_width)
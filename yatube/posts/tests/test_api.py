@@ -0,0 +1,117 @@
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.api import encode_api_cursor
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='api_author')
+        cls.reader = User.objects.create_user(username='api_reader')
+        cls.stranger = User.objects.create_user(username='api_stranger')
+        cls.group = Group.objects.create(title='Группа API', slug='api')
+        cls.posts = [
+            Post.objects.create(author=cls.author, group=cls.group,
+                                text=f'Пост API {i}')
+            for i in range(15)
+        ]
+        Comment.objects.create(post=cls.posts[0], author=cls.reader,
+                               text='Комментарий API')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Follow.objects.create(user=cls.stranger, author=cls.author)
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(ApiTest.reader)
+
+    def test_posts_cursor_pagination(self):
+        url = reverse('posts:api_posts')
+        first = self.client.get(url).json()
+        self.assertEqual(len(first['results']), 10)
+        self.assertEqual(first['results'][0]['text'], 'Пост API 14')
+        second = self.client.get(
+            url, {'cursor': first['next_cursor']}).json()
+        self.assertEqual(len(second['results']), 5)
+        self.assertIsNone(second['next_cursor'])
+        ids = [post['id'] for post in first['results'] + second['results']]
+        self.assertEqual(ids, sorted((post.pk for post in self.posts),
+                                     reverse=True))
+
+    def test_sparse_fields_query_only_needed_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:api_posts'),
+                                       {'fields': 'id,text', 'limit': 3})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('auth_user', queries[0]['sql'])
+        self.assertEqual(response.json()['results'][0],
+                         {'id': self.posts[-1].pk, 'text': 'Пост API 14'})
+
+    def test_related_fields_and_filters(self):
+        response = self.client.get(reverse('posts:api_posts'), {
+            'fields': 'id,author,group_title', 'author': 'api_author',
+            'limit': 1})
+        self.assertEqual(response.json()['results'][0]['author'],
+                         'api_author')
+        self.assertEqual(response.json()['results'][0]['group_title'],
+                         'Группа API')
+        comments = self.client.get(reverse('posts:api_comments'),
+                                   {'post': self.posts[0].pk}).json()
+        self.assertEqual([comment['text'] for comment in comments['results']],
+                         ['Комментарий API'])
+
+    def test_detail_and_errors(self):
+        response = self.client.get(
+            reverse('posts:api_group', kwargs={'key': 'api'}))
+        self.assertEqual(response.json()['title'], 'Группа API')
+        response = self.client.get(
+            reverse('posts:api_post', kwargs={'key': 10 ** 6}))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('posts:api_posts'),
+                                   {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('posts:api_posts'),
+                                   {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 400)
+        for value in ('abc', 5, None, ['2020-01-01']):
+            with self.subTest(value=value):
+                response = self.client.get(reverse('posts:api_posts'), {
+                    'cursor': encode_api_cursor(value, 1)})
+                self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('posts:api_posts'))
+        self.assertEqual(response.status_code, 405)
+
+    def test_follows_visible_only_to_participants(self):
+        url = reverse('posts:api_follows')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        follows = self.reader_client.get(url).json()['results']
+        self.assertEqual(follows, [{
+            'id': Follow.objects.get(user=self.reader).pk,
+            'user': 'api_reader',
+            'author': 'api_author',
+        }])
+
+    def test_bulk_follow_and_unfollow(self):
+        url = reverse('posts:api_follows_bulk')
+        body = {'follow': ['api_stranger', 'nobody'],
+                'unfollow': ['api_author']}
+        self.assertEqual(self.client.post(
+            url, body, content_type='application/json').status_code, 401)
+        response = self.reader_client.post(
+            url, body, content_type='application/json')
+        self.assertEqual(response.json(), {
+            'followed': ['api_stranger'],
+            'unfollowed': ['api_author'],
+            'unknown': ['nobody'],
+        })
+        self.assertEqual(
+            list(Follow.objects.filter(user=self.reader).values_list(
+                'author__username', flat=True)),
+            ['api_stranger'])
+        response = self.reader_client.post(
+            url, {'follow': 'api_author'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
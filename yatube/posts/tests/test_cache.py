@@ -0,0 +1,131 @@
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import (RequestFactory, TransactionTestCase,
+                         override_settings)
+
+from core.decorators import read_replica
+from core.routers import reads_from_replica, replica_reads
+from core.tests.test_cache import SharedCacheTestCase, tier
+from posts.caching import cache_page_by_generation, get_or_regenerate
+from posts.models import Post, User
+from posts.templatetags.post_cards import post_cards
+from posts.utils import CountedPaginator
+
+
+@override_settings(PAGE_CACHE_WAIT_SECONDS=1)
+class RegenerationTest(SharedCacheTestCase):
+    workers = {'default': tier('regeneration')}
+
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+    def render(self, value='fresh', delay=0):
+        def regenerate():
+            self.calls.append(value)
+            time.sleep(delay)
+            return value
+        return regenerate
+
+    def test_one_request_regenerates(self):
+        results = []
+
+        def request():
+            results.append(get_or_regenerate(
+                'page:index', 'stale:index', self.render(delay=0.2), 60))
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, ['fresh'])
+        self.assertEqual(results, ['fresh'] * 8)
+
+    def test_stale_served_while_new_version_renders(self):
+        get_or_regenerate('page:v1', 'stale:index', self.render('old'), 60)
+        # другой запрос уже перестраивает новую версию страницы
+        cache.add('lock:page:v2', True, 10)
+        value = get_or_regenerate('page:v2', 'stale:index',
+                                  self.render('new'), 60)
+        self.assertEqual(value, 'old')
+        self.assertEqual(self.calls, ['old'])
+
+    def test_expired_entry_regenerated_once_and_kept_as_stale(self):
+        get_or_regenerate('page:index', None, self.render('old'), 0.01)
+        time.sleep(0.05)
+        cache.add('lock:page:index', True, 10)
+        self.assertEqual(
+            get_or_regenerate('page:index', None, self.render('new'), 60),
+            'old')
+        cache.delete('lock:page:index')
+        self.assertEqual(
+            get_or_regenerate('page:index', None, self.render('new'), 60),
+            'new')
+        self.assertEqual(self.calls, ['old', 'new'])
+
+    @override_settings(PAGE_CACHE_WAIT_SECONDS=0.05)
+    def test_waiter_never_releases_foreign_lock(self):
+        cache.add('lock:page:index', 'other', 10)
+        self.assertEqual(
+            get_or_regenerate('page:index', None, self.render('new'), 60),
+            'new')
+        self.assertEqual(cache.get('lock:page:index'), 'other')
+
+    def test_released_lock_ends_wait(self):
+        cache.add('lock:page:index', 'other', 10)
+        threading.Timer(0.1, cache.delete, ['lock:page:index']).start()
+        started = time.monotonic()
+        get_or_regenerate('page:index', None, self.render('new'), 60)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(self.calls, ['new'])
+
+    def test_not_cacheable_value_not_stored(self):
+        get_or_regenerate('page:index', None, self.render(None), 60,
+                          cacheable=lambda value: value is not None)
+        self.assertIsNone(cache.get('page:index'))
+        self.assertIsNone(cache.get('lock:page:index'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaReadsNotCachedTest(TransactionTestCase):
+    """То, что попадает в общий кеш, не читается с отстающей реплики.
+
+    Вне транзакции теста: внутри нее чтения и так идут в основную базу.
+    """
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(username='replicated')
+        self.post = Post.objects.create(author=author, text='Пост')
+
+    def test_cached_page_rendered_from_primary(self):
+        @read_replica
+        @cache_page_by_generation(60, 'replica_page', lambda request: ['all'])
+        def view(request):
+            return HttpResponse(str(reads_from_replica()))
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        response = view(request)
+        self.assertEqual(response.content, b'False')
+
+    def test_cached_count_read_from_primary(self):
+        # алиаса replica нет: чтение с реплики закончилось бы ошибкой
+        with replica_reads():
+            paginator = CountedPaginator(Post.objects.all(), 10,
+                                         count_scope='all')
+            self.assertEqual(paginator.count, 1)
+
+    def test_cards_of_replica_posts_not_stored(self):
+        self.post._state.db = 'replica'
+        with mock.patch('posts.templatetags.post_cards.render_to_string',
+                        return_value='card') as render:
+            post_cards([self.post], False)
+            post_cards([self.post], False)
+        self.assertEqual(render.call_count, 2)
@@ -1,11 +1,24 @@
+import hashlib
 import shutil
 import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
-from django.test import TestCase, Client, override_settings
+from django.db import connection
+from django.test import (
+    TestCase, TransactionTestCase, Client, override_settings
+)
 from django.urls import reverse
 
-from posts.models import Post, Group, User
+from PIL import Image
+
+from posts.images import open_checked_image, variant_urls
+from posts.models import Post, Group, StoredFile, User
+from posts.thumbnails import queue
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -60,10 +73,9 @@ class PostFormTests(TestCase):
         post = Post.objects.get(author=PostFormTests.user)
         self.assertEqual(Post.objects.count(), 1)
         self.assertEqual(post.text, form_data['text'])
-        self.assertEqual(
-            post.image.name,
-            Post.image.field.upload_to + form_data['image'].name
-        )
+        self.assertTrue(post.image.name.startswith(
+            Post.image.field.upload_to))
+        self.assertTrue(post.image.name.endswith('.gif'))
         self.assertEqual(post.group.pk, form_data['group'])
         self.assertEqual(post.author, PostFormTests.user)
         self.assertRedirects(
@@ -112,3 +124,222 @@ class PostFormTests(TestCase):
                                          follow=True)
         self.assertEqual(response.context['comments'][0].text,
                          form_data['text'])
+
+    def test_create_post_gif_dimensions(self):
+        """GIF сохраняется как есть, размеры записываются в пост"""
+        self.auth_client.post(reverse('posts:post_create'),
+                              data={'text': 'Запись с гифкой',
+                                    'image': self.uploaded})
+        post = Post.objects.get(author=PostFormTests.user)
+        self.uploaded.seek(0)
+        with post.image.open('rb') as stored:
+            self.assertEqual(stored.read(), self.uploaded.read())
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+
+    @override_settings(POST_IMAGE_MAX_EDGE=100)
+    def test_large_photo_processed(self):
+        """большое фото уменьшается, теряет EXIF и получает вариант WebP"""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        buffer = BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(buffer, 'JPEG', exif=exif)
+        photo = SimpleUploadedFile('photo.jpg', buffer.getvalue(),
+                                   content_type='image/jpeg')
+        self.auth_client.post(reverse('posts:post_create'),
+                              data={'text': 'Запись с фотографией',
+                                    'image': photo})
+        post = Post.objects.get(author=PostFormTests.user)
+        self.assertEqual((post.image_width, post.image_height), (100, 50))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (100, 50))
+            self.assertFalse(stored.getexif())
+        self.assertIn('webp', variant_urls(post.image, post.image_width))
+        webp_name = post.image.name.rsplit('.', 1)[0] + '.webp'
+        self.assertTrue(post.image.storage.exists(webp_name))
+
+    @override_settings(POST_IMAGE_MAX_BYTES=10)
+    def test_too_heavy_image_rejected(self):
+        response = self.auth_client.post(reverse('posts:post_create'),
+                                         data={'text': 'Тяжелая картинка',
+                                               'image': self.uploaded})
+        self.assertFalse(Post.objects.exists())
+        self.assertTrue(response.context['form'].errors['image'])
+
+    def test_same_image_stored_once(self):
+        """одинаковые картинки хранятся одним файлом со счетчиком ссылок"""
+        for text in ('Первая запись', 'Вторая запись'):
+            self.uploaded.seek(0)
+            self.auth_client.post(reverse('posts:post_create'),
+                                  data={'text': text,
+                                        'image': self.uploaded})
+        first, second = Post.objects.order_by('pk')
+        self.assertEqual(first.image.name, second.image.name)
+        stored = StoredFile.objects.get(name=first.image.name)
+        self.assertEqual(stored.refs, 2)
+        first.delete()
+        stored.refresh_from_db()
+        self.assertEqual(stored.refs, 1)
+        self.assertTrue(second.image.storage.exists(second.image.name))
+        second.delete()
+        # после фиксации транзакции (в TestCase ее нет) вызывается release
+        stored.refresh_from_db()
+        self.assertEqual(stored.refs, 0)
+        second.image.storage.release(stored.name)
+        self.assertFalse(StoredFile.objects.exists())
+        self.assertFalse(second.image.storage.exists(stored.name))
+
+    def test_same_image_uploaded_again_keeps_one_reference(self):
+        """повторная загрузка тех же байтов в пост не копит ссылки"""
+        self.auth_client.post(reverse('posts:post_create'),
+                              data={'text': 'Первая запись',
+                                    'image': self.uploaded})
+        post = Post.objects.get()
+        self.uploaded.seek(0)
+        self.auth_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': 'Первая запись', 'image': self.uploaded})
+        post.refresh_from_db()
+        self.assertEqual(StoredFile.objects.get(name=post.image.name).refs, 1)
+        self.uploaded.seek(0)
+        post.image = self.uploaded
+        post.save()
+        self.assertEqual(StoredFile.objects.get(name=post.image.name).refs, 1)
+
+    def test_reference_added_before_release_keeps_file(self):
+        """файл, на который сослались до удаления, остается на месте"""
+        self.auth_client.post(reverse('posts:post_create'),
+                              data={'text': 'Первая запись',
+                                    'image': self.uploaded})
+        post = Post.objects.get()
+        storage, name = post.image.storage, post.image.name
+        post.delete()
+        storage.add_reference(name)
+        storage.release(name)
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 1)
+        self.assertTrue(storage.exists(name))
+
+    def test_not_image_rejected_while_uploading(self):
+        """файл без сигнатуры картинки отклоняется обработчиком загрузки"""
+        fake = SimpleUploadedFile('fake.gif', b'<html>' * 1000,
+                                  content_type='image/gif')
+        response = self.auth_client.post(reverse('posts:post_create'),
+                                         data={'text': 'Запись с подделкой',
+                                               'image': fake})
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(response.context['form'].errors['image'],
+                         ['Файл не является картинкой'])
+
+    def test_decompression_bomb_rejected(self):
+        """картинку, от которой Pillow отказывается, отклоняет форма"""
+        buffer = BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(buffer, 'JPEG')
+        bomb = SimpleUploadedFile('bomb.jpg', buffer.getvalue(),
+                                  content_type='image/jpeg')
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100):
+            response = self.auth_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Запись с бомбой', 'image': bomb})
+            with self.assertRaises(ValidationError):
+                open_checked_image(bomb)
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(response.context['form'].errors['image'],
+                         ['Слишком большое разрешение картинки'])
+
+    def test_truncated_image_rejected(self):
+        """обрезанный JPEG с верной сигнатурой - ошибка формы, а не 500"""
+        buffer = BytesIO()
+        Image.effect_noise((400, 300), 64).save(buffer, 'JPEG')
+        data = buffer.getvalue()
+        truncated = SimpleUploadedFile('broken.jpg', data[:len(data) // 2],
+                                       content_type='image/jpeg')
+        response = self.auth_client.post(reverse('posts:post_create'),
+                                         data={'text': 'Обрезанная картинка',
+                                               'image': truncated})
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(response.context['form'].errors['image'],
+                         ['Не удалось прочитать картинку'])
+
+    def test_header_only_image_rejected(self):
+        """файл, оборванный на заголовке, отклоняется в конце загрузки"""
+        stub = SimpleUploadedFile('stub.jpg', b'\xff\xd8\xff\xe0' + b'\0' * 8,
+                                  content_type='image/jpeg')
+        response = self.auth_client.post(reverse('posts:post_create'),
+                                         data={'text': 'Обрыв на заголовке',
+                                               'image': stub})
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(response.context['form'].errors['image'],
+                         ['Не удалось прочитать заголовок картинки'])
+
+    def test_cmyk_image_accepted(self):
+        buffer = BytesIO()
+        Image.new('CMYK', (40, 20)).save(buffer, 'JPEG')
+        photo = SimpleUploadedFile('cmyk.jpg', buffer.getvalue(),
+                                   content_type='image/jpeg')
+        self.auth_client.post(reverse('posts:post_create'),
+                              data={'text': 'Картинка в CMYK',
+                                    'image': photo})
+        post = Post.objects.get(author=PostFormTests.user)
+        self.assertEqual((post.image_width, post.image_height), (40, 20))
+
+    def test_streamed_upload_hash_reused(self):
+        """хеш загрузки считается при приеме и совпадает с именем файла"""
+        self.auth_client.post(reverse('posts:post_create'),
+                              data={'text': 'Запись с гифкой',
+                                    'image': self.uploaded})
+        post = Post.objects.get(author=PostFormTests.user)
+        self.uploaded.seek(0)
+        digest = hashlib.sha256(self.uploaded.read()).hexdigest()
+        self.assertEqual(post.image.name,
+                         f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class WriteLockTest(TransactionTestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='writer'))
+        self.statements = []
+        # вне TestCase on_commit срабатывает, и фоновые миниатюры
+        # читали бы базу, пока ее очищает следующий тест
+        patcher = mock.patch.object(queue, 'submit')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def capture(self, execute, sql, params, many, context):
+        self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+    def test_form_page_takes_no_write_lock(self):
+        with connection.execute_wrapper(self.capture):
+            self.client.get(reverse('posts:post_create'))
+        self.assertNotIn('BEGIN IMMEDIATE', self.statements)
+
+    def test_image_stored_before_write_lock(self):
+        buffer = BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(buffer, 'JPEG')
+        photo = SimpleUploadedFile('red.jpg', buffer.getvalue(),
+                                   content_type='image/jpeg')
+        with connection.execute_wrapper(self.capture):
+            self.client.post(reverse('posts:post_create'),
+                             data={'text': 'Запись под блокировкой',
+                                   'image': photo})
+        post = Post.objects.get()
+        self.assertEqual((post.image_width, post.image_height), (40, 20))
+        self.assertTrue(post.image.storage.exists(post.image.name))
+        begin = self.statements.index('BEGIN IMMEDIATE')
+        stored = [index for index, sql in enumerate(self.statements)
+                  if 'posts_storedfile' in sql]
+        self.assertTrue(stored)
+        self.assertLess(max(stored), begin)
+
+    def test_release_checks_references_under_write_lock(self):
+        storage = Post.image.field.storage
+        name = storage.save('posts/lock.gif', ContentFile(b'GIF89a'))
+        StoredFile.objects.filter(name=name).update(refs=0)
+        with connection.execute_wrapper(self.capture):
+            storage.release(name)
+        begin = self.statements.index('BEGIN IMMEDIATE')
+        checked = [index for index, sql in enumerate(self.statements)
+                   if 'posts_storedfile' in sql]
+        self.assertLess(begin, min(checked))
+        self.assertFalse(StoredFile.objects.exists())
+        self.assertFalse(storage.exists(name))
@@ -1,6 +1,23 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from collections import defaultdict
+from io import StringIO
+from unittest import mock
 
-from ..models import Group, Post, User
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ..benchmark import Benchmark, compare, percentile
+from ..counters import recount_all
+from ..follows import add_follows, remove_follows
+from ..models import (
+    Comment, FeedEntry, Follow, Group, Post, StoredFile, User, UserStats
+)
+from ..seeding import Seeder
 
 
 class PostModelTest(TestCase):
@@ -30,3 +47,294 @@ class PostModelTest(TestCase):
         group = PostModelTest.group
         expected_object_name = group.title
         self.assertEqual(expected_object_name, str(group))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='counted_author')
+        cls.reader = User.objects.create_user(username='counted_reader')
+        cls.post = Post.objects.create(author=cls.author,
+                                       text='Пост со счетчиками')
+
+    def test_counters_follow_write_paths(self):
+        """Счетчики меняются при создании и удалении объектов"""
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 0)
+
+    def test_post_moved_between_authors(self):
+        """Смена автора поста переносит его между счетчиками авторов"""
+        post = Post.objects.get(pk=self.post.pk)
+        post.author = self.reader
+        post.save()
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 0)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).posts_count, 1)
+        self.assertEqual(recount_all(fix=False), [])
+
+    def test_rebuild_counters_command_fixes_drift(self):
+        """rebuild_counters находит и исправляет расхождения"""
+        UserStats.objects.filter(user=self.author).update(posts_count=7)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_counters', '--check', stdout=StringIO())
+
+    def test_check_reports_only_drifted_rows(self):
+        """Проверка перечисляет разошедшиеся строки и ничего не меняет"""
+        UserStats.objects.filter(user=self.reader).delete()
+        Post.objects.filter(pk=self.post.pk).update(comments_count=3)
+        self.assertEqual(recount_all(fix=False), [
+            f'user {self.reader.pk}: нет счетчиков',
+            f'post {self.post.pk}: comments_count 3 != 0',
+        ])
+        self.assertFalse(UserStats.objects.filter(user=self.reader).exists())
+        recount_all()
+        self.assertEqual(recount_all(fix=False), [])
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1)
+        call_command('rebuild_counters', '--check', stdout=StringIO())
+
+
+class BulkFollowTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='onboarded')
+        cls.authors = [
+            User.objects.create_user(username=f'suggested_{i}')
+            for i in range(30)
+        ]
+        cls.posts = [Post.objects.create(author=author, text='Пост')
+                     for author in cls.authors]
+
+    def pairs(self, count):
+        return [(self.reader.pk, author.pk)
+                for author in self.authors[:count]]
+
+    def test_queries_do_not_depend_on_number_of_authors(self):
+        with CaptureQueriesContext(connection) as one:
+            add_follows(self.pairs(1))
+        with CaptureQueriesContext(connection) as many:
+            add_follows(self.pairs(30))
+        self.assertEqual(len(one), len(many))
+        with CaptureQueriesContext(connection) as one:
+            remove_follows(self.pairs(1))
+        with CaptureQueriesContext(connection) as many:
+            remove_follows(self.pairs(30))
+        self.assertEqual(len(one), len(many))
+
+    def test_counters_and_feed_match_signal_path(self):
+        add_follows(self.pairs(10) + [(self.reader.pk, self.reader.pk)])
+        add_follows(self.pairs(5))
+        self.assertEqual(Follow.objects.filter(user=self.reader).count(), 10)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 10)
+        self.assertEqual(
+            UserStats.objects.get(user=self.authors[0]).followers_count, 1)
+        self.assertEqual(
+            set(FeedEntry.objects.filter(user=self.reader).values_list(
+                'post_id', flat=True)),
+            {post.pk for post in self.posts[:10]})
+        remove_follows(self.pairs(3))
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 7)
+        self.assertEqual(
+            UserStats.objects.get(user=self.authors[0]).followers_count, 0)
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(), 7)
+        self.assertEqual(recount_all(fix=False), [])
+
+    def test_follow_graph_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        graph = os.path.join(directory, 'follow.csv')
+        with open(graph, 'w', encoding='utf-8') as stream:
+            stream.write('user,author\n')
+            for author in self.authors[:4]:
+                stream.write(f'onboarded,{author.username}\n')
+            stream.write('onboarded,nobody\n')
+        call_command('follow_users', '--graph', graph, '--batch-size', '2',
+                     stdout=StringIO())
+        self.assertEqual(Follow.objects.filter(user=self.reader).count(), 4)
+        call_command('follow_users', 'onboarded', 'suggested_0',
+                     '--unfollow', stdout=StringIO())
+        self.assertEqual(Follow.objects.filter(user=self.reader).count(), 3)
+
+
+class TransferTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        cls.author = User.objects.create_user(username='transfer_author')
+        cls.reader = User.objects.create_user(username='transfer_reader')
+        cls.group = Group.objects.create(title='Группа выгрузки',
+                                         slug='transfer')
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Пост для выгрузки')
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text='Комментарий, с "кавычками"\nи строкой')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def wipe(self):
+        Post.objects.all().delete()
+        Group.objects.all().delete()
+        User.objects.filter(username='transfer_reader').delete()
+
+    def check_restored(self):
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.pub_date, self.post.pub_date)
+        self.assertEqual(post.group.slug, 'transfer')
+        self.assertEqual(post.comments_count, 1)
+        comment = post.comments.get()
+        self.assertEqual(comment.text, 'Комментарий, с "кавычками"\nи строкой')
+        self.assertEqual(comment.author.username, 'transfer_reader')
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 1)
+
+    def test_jsonl_round_trip(self):
+        path = os.path.join(self.directory, 'dump.jsonl')
+        call_command('export_posts', path, stderr=StringIO())
+        self.wipe()
+        call_command('import_posts', path, '--create-users',
+                     stdout=StringIO())
+        self.check_restored()
+
+    def test_import_into_filled_db_keeps_comments_on_their_posts(self):
+        root = Comment.objects.get()
+        reply = Comment(post=self.post, author=self.author, text='Ответ')
+        reply.reply_to(root, max_depth=5)
+        reply.save()
+        path = os.path.join(self.directory, 'filled.jsonl')
+        call_command('export_posts', path, stderr=StringIO())
+        call_command('import_posts', path, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 2)
+        copy = Post.objects.exclude(pk=self.post.pk).get()
+        self.assertEqual(copy.comments_count, 2)
+        copied_root, copied_reply = copy.comments.order_by('path')
+        self.assertNotEqual(copied_root.pk, root.pk)
+        self.assertEqual(copied_reply.parent_id, copied_root.pk)
+        self.assertEqual(copied_reply.thread_id, copied_root.pk)
+        self.assertEqual(copied_reply.path, f'{copied_root.pk:010d}')
+        self.assertEqual(self.post.comments.count(), 2)
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_comments_without_post_reported(self):
+        path = os.path.join(self.directory, 'orphans.jsonl')
+        call_command('export_posts', path, '--models', 'comment',
+                     stderr=StringIO())
+        Post.objects.all().delete()
+        out = StringIO()
+        call_command('import_posts', path, stdout=out)
+        self.assertFalse(Comment.objects.exists())
+        self.assertIn('Пропущено комментариев к отсутствующим постам: 1',
+                      out.getvalue())
+
+    def test_csv_round_trip(self):
+        path = os.path.join(self.directory, 'csv')
+        call_command('export_posts', path, '--format', 'csv',
+                     stderr=StringIO())
+        self.wipe()
+        call_command('import_posts', path, '--format', 'csv',
+                     '--create-users', '--batch-size', '1',
+                     stdout=StringIO())
+        self.check_restored()
+
+    def test_missing_users_skipped_without_create_users(self):
+        path = os.path.join(self.directory, 'skip.jsonl')
+        call_command('export_posts', path, '--models', 'comment',
+                     stderr=StringIO())
+        Comment.objects.all().delete()
+        User.objects.filter(username='transfer_reader').delete()
+        out = StringIO()
+        call_command('import_posts', path, stdout=out)
+        self.assertFalse(Comment.objects.exists())
+        self.assertIn('Пропущено записей без пользователя: 1', out.getvalue())
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SeedAndBenchmarkTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command('seed_yatube', '--users', 20, '--groups', 3,
+                     '--posts', 120, '--comments', 200, '--follows', 60,
+                     '--images', 0.2, stdout=StringIO())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_seed_volumes_and_consistent_counters(self):
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Post.objects.count(), 120)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertEqual(Follow.objects.count(), 60)
+        self.assertTrue(FeedEntry.objects.exists())
+        self.assertEqual(recount_all(fix=False), [])
+        images = Post.objects.exclude(image='')
+        self.assertTrue(images.exists())
+        for stored in StoredFile.objects.all():
+            self.assertEqual(
+                stored.refs, images.filter(image=stored.name).count())
+
+    def test_posts_and_comments_inserted_in_batches(self):
+        seeder = Seeder(users=5, groups=1, posts=30, comments=40, follows=5,
+                        images=0, prefix='batched', batch_size=7)
+        sizes = defaultdict(list)
+        insert = seeder.bulk_create
+
+        def record(model, objects):
+            sizes[model].append(len(objects))
+            insert(model, objects)
+
+        with mock.patch.object(seeder, 'bulk_create', record):
+            seeder.run()
+        for model, total in ((Post, 30), (Comment, 40)):
+            self.assertEqual(sum(sizes[model]), total)
+            self.assertLessEqual(max(sizes[model]), 7)
+
+    def test_follow_graph_is_skewed(self):
+        followers = sorted(
+            UserStats.objects.values_list('followers_count', flat=True),
+            reverse=True)
+        self.assertGreater(followers[0], 60 / 20 * 2)
+
+    def test_benchmark_reports_percentiles_and_compares(self):
+        benchmark = Benchmark(requests=3, warmup=1, cold=True)
+        report = benchmark.report(
+            benchmark.run(['index', 'post_detail', 'follow_index']))
+        result = report['results']['index']
+        self.assertEqual(set(result), {'p50_ms', 'p95_ms', 'p99_ms',
+                                       'queries', 'peak_kib'})
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(compare(report, report), [])
+        baseline = {'results': {'index': dict(result, queries=0)}}
+        self.assertEqual(len(compare(report, baseline)), 1)
+
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([5], 95), 5)
@@ -1,15 +1,25 @@
 import shutil
 import tempfile
+from unittest import mock
+
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 from django.core.cache import cache
 
-from django.test import TestCase, Client, override_settings
+from django.template import Context, Template
+from django.test import (
+    SimpleTestCase, TestCase, Client, RequestFactory, override_settings
+)
 
 from django.urls import reverse
 from django import forms
 
-from posts.models import Post, Group, User, Comment, Follow
+from core.decorators import QueryBudgetExceeded, query_budget
+from posts.threads import replies_page, thread, thread_page
+from posts.thumbnails import (
+    ThumbnailQueue, generate_thumbnails, schedule_thumbnails
+)
+from posts.models import Post, Group, User, Comment, Follow, FeedEntry
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -182,16 +192,63 @@ class PostURLTests(TestCase):
 
     def test_cache_in_index_page(self):
         """Проверка работы кеша на главной странице"""
+        cache.clear()
         response = self.authorized_client.get(reverse('posts:index'))
         old_content = response.content
+        # update() не отправляет сигналов, страница остается в кеше
+        Post.objects.filter(id=PostURLTests.post.id).update(
+            text='Изменено в обход сигналов')
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(old_content, response.content)
         Post.objects.get(id=PostURLTests.post.id).delete()
         response = self.authorized_client.get(reverse('posts:index'))
-        new_content = response.content
-        self.assertEqual(old_content, new_content)
+        self.assertNotEqual(old_content, response.content)
+
+    def test_thumbnail_falls_back_to_original_until_generated(self):
+        """Пока миниатюры нет, в карточке ссылка на оригинал"""
         cache.clear()
-        response = self.authorized_client.get(reverse('posts:index'))
-        new_content = response.content
-        self.assertNotEqual(old_content, new_content)
+        index = reverse('posts:index')
+        original = PostURLTests.post.image.url
+        response = self.guest_client.get(index)
+        self.assertContains(response, f'src="{original}"')
+        generate_thumbnails(PostURLTests.post.pk)
+        response = self.guest_client.get(index)
+        self.assertNotContains(response, f'src="{original}"')
+        self.assertContains(response, 'src="/media/cache/')
+
+    def test_cache_keeps_query_and_user_variants(self):
+        """Кеш различает параметры запроса и пользователей"""
+        cache.clear()
+        index = reverse('posts:index')
+        guest_page = self.guest_client.get(index).content
+        user_page = self.authorized_client.get(index).content
+        self.assertNotEqual(guest_page, user_page)
+        self.assertNotIn('Избранные авторы'.encode(), guest_page)
+        self.assertIn('Избранные авторы'.encode(), user_page)
+        search_page = self.guest_client.get(index, {'q': 'нет такого'})
+        self.assertNotEqual(guest_page, search_page.content)
+
+
+class ThumbnailQueueTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.queue = ThumbnailQueue(workers=0, retries=3, retry_delay=1)
+
+    @mock.patch('posts.thumbnails.time.sleep')
+    @mock.patch('posts.thumbnails.generate_thumbnails',
+                side_effect=OSError('битая картинка'))
+    def test_failed_post_not_requeued_until_new_image(self, generate, sleep):
+        """После последней неудачи пауз больше нет, а пост какое-то время
+        не ставится в очередь снова, если картинка не сменилась"""
+        with self.assertLogs('posts.thumbnails', 'ERROR'):
+            self.queue.run(1)
+        self.assertEqual(generate.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+        with mock.patch('posts.thumbnails.transaction.on_commit') as queued:
+            schedule_thumbnails(1)
+            queued.assert_not_called()
+            schedule_thumbnails(1, new_image=True)
+            queued.assert_called_once()
 
 
 class PaginatorViewsTest(TestCase):
@@ -231,3 +288,481 @@ class PaginatorViewsTest(TestCase):
         for page in self.templates_posts:
             response = self.client.get(page + '?page=2')
             self.assertEqual(len(response.context['page_obj']), 5)
+
+    def test_cursor_pages_walk_forward_and_back(self):
+        """Курсорная пагинация отдает те же записи в обе стороны"""
+        cache.clear()
+        for page in self.templates_posts:
+            with self.subTest(page=page):
+                response = self.client.get(page + '?cursor=')
+                first = response.context['page_obj']
+                self.assertEqual(len(first), 10)
+                self.assertFalse(first.has_previous())
+                response = self.client.get(
+                    page + '?cursor=' + first.next_cursor)
+                second = response.context['page_obj']
+                self.assertEqual(len(second), 5)
+                self.assertFalse(second.has_next())
+                response = self.client.get(
+                    page + '?cursor=' + second.previous_cursor)
+                back = response.context['page_obj']
+                self.assertEqual(
+                    [post.pk for post in back],
+                    [post.pk for post in first]
+                )
+
+    def test_post_count_is_cached_and_reset_on_new_post(self):
+        """Количество постов берется из кеша и сбрасывается сигналом"""
+        cache.clear()
+        url = reverse('posts:profile', kwargs={'username': 'page_user'})
+        response = self.client.get(url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 15)
+        Post.objects.create(text='Еще один пост', author=self.user)
+        response = self.client.get(url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 16)
+
+    @override_settings(POST_COUNT_APPROXIMATE_ABOVE=12)
+    def test_post_count_is_approximate_above_limit(self):
+        """Большие ленты не пересчитываются точно"""
+        cache.clear()
+        response = self.client.get(reverse('posts:index'))
+        paginator = response.context['page_obj'].paginator
+        self.assertEqual(paginator.count, 12)
+        self.assertTrue(paginator.approximate)
+
+    @override_settings(POST_COUNT_APPROXIMATE_ABOVE=5)
+    def test_pages_past_approximate_count_reachable(self):
+        """Примерное количество не ограничивает переход по страницам"""
+        cache.clear()
+        response = self.client.get(reverse('posts:index'))
+        first = response.context['page_obj']
+        self.assertEqual(first.paginator.num_pages, 1)
+        self.assertTrue(first.has_next())
+        response = self.client.get(reverse('posts:index'), {'page': 2})
+        second = response.context['page_obj']
+        self.assertEqual(second.number, 2)
+        self.assertEqual(len(second), 5)
+        self.assertFalse(second.has_next())
+
+    @override_settings(POST_COUNT_APPROXIMATE_ABOVE=5)
+    def test_too_deep_approximate_page_shows_last_page(self):
+        """Слишком далекая страница при примерном количестве - последняя"""
+        cache.clear()
+        response = self.client.get(reverse('posts:index'), {'page': 999})
+        self.assertEqual(response.status_code, 200)
+        page = response.context['page_obj']
+        self.assertEqual(page.number, 2)
+        self.assertEqual(len(page), 5)
+        self.assertFalse(page.has_next())
+
+
+class SearchViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='search_user')
+        cls.exact = Post.objects.create(
+            author=cls.user, text='Кошка кошка кошка спит на окне')
+        cls.prefix = Post.objects.create(
+            author=cls.user, text='Кошки гуляют сами по себе')
+        cls.other = Post.objects.create(
+            author=cls.user, text='Собака охраняет двор')
+
+    def test_search_finds_prefixes_ranked(self):
+        """Поиск находит слова по префиксу и сортирует по релевантности"""
+        response = self.client.get(reverse('posts:index'), {'q': 'кошк'})
+        found = [post.pk for post in response.context['page_obj']]
+        self.assertEqual(found, [self.exact.pk, self.prefix.pk])
+
+    def test_search_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при изменении и удалении поста"""
+        self.other.text = 'Кошка охраняет двор'
+        self.other.save()
+        response = self.client.get(reverse('posts:index'), {'q': 'охраня'})
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [self.other.pk]
+        )
+        self.other.delete()
+        response = self.client.get(reverse('posts:index'), {'q': 'охраня'})
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+
+class FollowFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='feed_author')
+        cls.reader = User.objects.create_user(username='feed_reader')
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(FollowFeedTest.reader)
+
+    def feed_ids(self):
+        cache.clear()
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_feed_is_materialized_on_write(self):
+        """Посты раскладываются по лентам и убираются при отписке"""
+        old = Post.objects.create(author=self.author, text='Старый пост')
+        Follow.objects.create(user=self.reader, author=self.author)
+        new = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.reader).count(), 2)
+        self.assertEqual(self.feed_ids(), [new.pk, old.pk])
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.feed_ids(), [])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_popular_author_is_read_on_demand(self):
+        """Посты популярного автора подмешиваются при чтении ленты"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Пост звезды')
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.feed_ids(), [post.pk])
+
+    def test_author_back_below_threshold_fills_feeds(self):
+        """Посты, написанные, пока автор был популярным, попадают
+        в ленты, когда его посты снова раскладываются при записи"""
+        other = User.objects.create_user(username='feed_other')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        with override_settings(FEED_FANOUT_MAX_FOLLOWERS=1):
+            post = Post.objects.create(author=self.author, text='Пост звезды')
+            self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+            Follow.objects.filter(user=other).delete()
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.reader, post=post).exists())
+
+    def test_post_moves_between_feeds_with_author(self):
+        """Смена автора переносит пост в ленты подписчиков нового автора"""
+        other = User.objects.create_user(username='feed_new_author')
+        fan = User.objects.create_user(username='feed_fan')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=fan, author=other)
+        post = Post.objects.create(author=self.author, text='Пост')
+        post.author = other
+        post.save()
+        self.assertEqual(
+            list(FeedEntry.objects.filter(post=post).values_list(
+                'user_id', flat=True)),
+            [fan.pk])
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='card_author')
+        cls.group = Group.objects.create(title='Карточки', slug='cards')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Пост в карточке', group=cls.group)
+
+    def render_cards(self):
+        template = Template(
+            "{% load post_cards %}"
+            "{% post_cards posts 'index_page' as cards %}"
+            "{% for card in cards %}{{ card }}{% endfor %}"
+        )
+        return template.render(Context(
+            {'posts': Post.objects.select_related('author', 'group')}))
+
+    def test_cards_are_cached_until_post_group_or_author_change(self):
+        """Карточка берется из кеша и сбрасывается при изменениях"""
+        cache.clear()
+        self.assertIn('Карточки', self.render_cards())
+        Group.objects.filter(pk=self.group.pk).update(title='Обход')
+        self.assertIn('Карточки', self.render_cards())
+        self.group.title = 'Новое имя группы'
+        self.group.save()
+        self.assertIn('Новое имя группы', self.render_cards())
+        self.user.first_name = 'Автор'
+        self.user.last_name = 'Карточки'
+        self.user.save()
+        self.assertIn('Автор Карточки', self.render_cards())
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class QueryBudgetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='budget_author')
+        cls.reader = User.objects.create_user(username='budget_reader')
+        cls.group = Group.objects.create(title='Бюджет', slug='budget')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(15):
+            cls.post = Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост бюджета {i}')
+            Comment.objects.create(
+                post=cls.post, author=cls.reader, text=f'Комментарий {i}')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(QueryBudgetTest.reader)
+        self.author_client = Client()
+        self.author_client.force_login(QueryBudgetTest.author)
+
+    def test_read_views_fit_query_budget(self):
+        """Страницы чтения укладываются в свой бюджет запросов"""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:index') + '?q=бюджет',
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_create'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.reader_client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_write_views_fit_query_budget(self):
+        """Изменяющие представления укладываются в свой бюджет запросов"""
+        self.author_client.post(reverse('posts:post_create'),
+                                {'text': 'Еще один пост для бюджета'})
+        self.author_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+            {'text': 'Исправленный пост для бюджета'})
+        self.reader_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Комментарий в бюджете'})
+        self.reader_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.author}))
+        self.reader_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author}))
+
+    def test_budget_overflow_is_an_error_in_tests(self):
+        """Превышение бюджета в тестах приводит к исключению"""
+        @query_budget(0)
+        def view(request):
+            return list(Post.objects.all()[:1])
+
+        with self.assertRaises(QueryBudgetExceeded):
+            view(RequestFactory().get('/'))
+
+
+class ConditionalRequestTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='etag_author')
+        cls.reader = User.objects.create_user(username='etag_reader')
+        cls.post = Post.objects.create(author=cls.author,
+                                       text='Пост для валидаторов')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(ConditionalRequestTest.reader)
+
+    def test_unchanged_index_is_not_modified_without_queries(self):
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.content)
+
+    def test_if_modified_since_is_respected(self):
+        url = reverse('posts:profile', kwargs={'username': self.author})
+        response = self.client.get(url)
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_invalidate_etag(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Новый комментарий')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новый комментарий')
+
+    def test_authenticated_pages_vary_per_user(self):
+        url = reverse('posts:follow_index')
+        response = self.reader_client.get(url)
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+        self.assertEqual(self.reader_client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        author_client = Client()
+        author_client.force_login(ConditionalRequestTest.author)
+        self.assertEqual(author_client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        Post.objects.create(author=self.author, text='Новый пост автора')
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новый пост автора')
+
+    def test_new_login_gets_fresh_comment_form(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        etag = self.reader_client.get(url)['ETag']
+        self.assertEqual(self.reader_client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.reader_client.logout()
+        self.reader_client.force_login(ConditionalRequestTest.reader)
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+
+@override_settings(COMMENTS_PER_PAGE=20)
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='talkative')
+        cls.post = Post.objects.create(author=cls.author, text='Вирусный пост')
+        cls.comments = [
+            Comment.objects.create(post=cls.post, author=cls.author,
+                                   text=f'Комментарий {i}')
+            for i in range(25)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_detail_renders_first_page(self):
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        comments = response.context['comments']
+        self.assertEqual([comment.text for comment in comments],
+                         [f'Комментарий {i}' for i in range(24, 4, -1)])
+        self.assertTrue(comments.has_next())
+        self.assertContains(response, 'data-comments-more')
+
+    def test_next_pages_loaded_as_fragment(self):
+        first = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        url = reverse('posts:post_comments',
+                      kwargs={'post_id': self.post.pk})
+        cache.clear()
+        # id корней страницы и одним запросом их ветки
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                url, {'cursor': first.context['comments'].next_cursor})
+        self.assertEqual([comment.text for comment in
+                          response.context['comments']],
+                         [f'Комментарий {i}' for i in range(4, -1, -1)])
+        self.assertNotContains(response, 'data-comments-more')
+        self.assertNotContains(response, '<html')
+
+
+class CommentThreadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='debater')
+        cls.post = Post.objects.create(author=cls.author, text='Спорный пост')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.author)
+
+    def comment(self, text, parent=None, max_depth=5):
+        comment = Comment(post=self.post, author=self.author, text=text)
+        if parent is not None:
+            comment.reply_to(parent, max_depth)
+        comment.save()
+        return comment
+
+    def reply(self, parent):
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Ответ', 'parent': parent.pk})
+        return Comment.objects.latest('pk')
+
+    def test_threads_flattened_in_display_order(self):
+        first = self.comment('Первый')
+        answer = self.comment('Ответ', parent=first)
+        deep = self.comment('Ответ на ответ', parent=answer)
+        late = self.comment('Поздний ответ', parent=first)
+        last = self.comment('Последний')
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        page = response.context['comments']
+        self.assertEqual(list(page), [last, first])
+        self.assertEqual(page.tree, [last, first, answer, deep, late])
+        self.assertEqual([comment.depth for comment in page.tree],
+                         [0, 0, 1, 2, 1])
+
+    def test_thread_loaded_in_one_query(self):
+        root = self.comment('Корень')
+        parent = root
+        for _ in range(4):
+            parent = self.comment('Ответ', parent=parent)
+        with self.assertNumQueries(1):
+            comments = thread(root.pk)
+        self.assertEqual([comment.depth for comment in comments],
+                         [0, 1, 2, 3, 4])
+
+    @override_settings(COMMENT_REPLIES_PER_THREAD=5)
+    def test_wide_thread_shown_in_chunks(self):
+        root = self.comment('Корень')
+        replies = [self.comment(f'Ответ {i}', parent=root)
+                   for i in range(12)]
+        with self.assertNumQueries(2):
+            page = thread_page(self.post.pk)
+        self.assertEqual(page.tree, [root] + replies[:5])
+        shown = []
+        cursor = page.tree[-1].more_replies
+        while cursor:
+            response = self.client.get(reverse(
+                'posts:comment_replies',
+                kwargs={'post_id': self.post.pk, 'comment_id': root.pk}
+            ), {'cursor': cursor})
+            chunk = response.context['comments']['tree']
+            self.assertLessEqual(len(chunk), 5)
+            shown += chunk
+            cursor = getattr(chunk[-1], 'more_replies', None)
+        self.assertEqual(shown, replies[5:])
+
+    @override_settings(COMMENT_REPLIES_PER_THREAD=3)
+    def test_deep_thread_capped_with_ancestors(self):
+        root = self.comment('Корень')
+        parent = root
+        for _ in range(5):
+            parent = self.comment('Ответ', parent=parent)
+        page = thread_page(self.post.pk)
+        self.assertEqual([comment.depth for comment in page.tree],
+                         [0, 1, 2, 3])
+        self.assertTrue(page.tree[-1].more_replies)
+        rest = replies_page(self.post.pk, root.pk,
+                            page.tree[-1].more_replies)
+        self.assertEqual([comment.depth for comment in rest], [4, 5])
+        self.assertEqual(replies_page(self.post.pk, root.pk, 'x-1'),
+                         page.tree[1:])
+
+    def test_reply_posted_with_parent(self):
+        root = self.comment('Корень')
+        reply = self.reply(root)
+        self.assertEqual(
+            (reply.parent_id, reply.thread_id, reply.depth),
+            (root.pk, root.pk, 1))
+
+    @override_settings(COMMENT_MAX_DEPTH=1)
+    def test_reply_below_max_depth_attached_to_grandparent(self):
+        root = self.comment('Корень')
+        answer = self.comment('Ответ', parent=root)
+        reply = self.reply(answer)
+        self.assertEqual((reply.parent_id, reply.depth), (root.pk, 1))
+
+    def test_parent_from_other_post_ignored(self):
+        other = Post.objects.create(author=self.author, text='Другой пост')
+        foreign = Comment.objects.create(
+            post=other, author=self.author, text='Чужой')
+        reply = self.reply(foreign)
+        self.assertIsNone(reply.parent_id)
@@ -0,0 +1,145 @@
+import re
+
+from django.db.models import OuterRef, Q, Subquery
+
+from django.conf import settings as yatube_conf
+
+from .models import Comment
+from .utils import CursorPaginator
+
+REPLY_CURSOR = re.compile(r'(\d+)-(\d+)')
+
+
+def encode_reply_cursor(path, pk):
+    """Позиция ответа в ветке (path, id) для ссылки «еще ответы»"""
+    return f'{path}-{pk}'
+
+
+def decode_reply_cursor(token):
+    """(path, id) из токена или None для испорченного токена"""
+    match = REPLY_CURSOR.fullmatch(token or '')
+    if match is None or len(match[1]) % Comment.PATH_SEGMENT:
+        return None
+    return match[1], int(match[2])
+
+
+def from_position(path, pk):
+    """Ответы ветки, начиная с позиции (path, id) в порядке вывода"""
+    return Q(path__gt=path) | Q(path=path, pk__gte=pk)
+
+
+def with_reply_bounds(roots, limit):
+    """Добавляет корням позицию первого ответа сверх limit.
+
+    Подзапрос читает не больше limit + 1 строк ветки по индексу
+    (thread, path, id). У веток, где ответов не больше limit,
+    позиция пустая.
+    """
+    hidden = Comment.objects.filter(
+        thread_id=OuterRef('pk')).order_by('path', 'id')[limit:limit + 1]
+    return roots.annotate(more_path=Subquery(hidden.values('path')),
+                          more_id=Subquery(hidden.values('pk')))
+
+
+def subtrees(root_ids, bounds=None):
+    """Ветки комментариев с корнями root_ids одним запросом.
+
+    Сортировка по (path, id) ставит каждого предка раньше потомков:
+    путь предка - префикс пути потомка. bounds - {id корня: (path, id)}
+    первого ответа, который не нужен: ветка обрезается по нему.
+    """
+    condition = Q(pk__in=root_ids)
+    if not bounds:
+        condition |= Q(thread_id__in=root_ids)
+    for root_id in root_ids if bounds else ():
+        replies = Q(thread_id=root_id)
+        if root_id in bounds:
+            replies &= ~from_position(*bounds[root_id])
+        condition |= replies
+    return Comment.objects.select_related('author').filter(
+        condition).order_by('path', 'id')
+
+
+def flatten(comments, root_ids):
+    """Раскладывает ветки в плоский список для вывода с отступами.
+
+    Дерево собирается за один проход (родитель всегда раньше ответов),
+    затем обходится стеком без рекурсии. Ответы идут в порядке
+    написания, ветки - в порядке root_ids. Время линейно по числу
+    комментариев.
+    """
+    nodes = {}
+    for comment in comments:
+        comment.children = []
+        nodes[comment.pk] = comment
+        parent = nodes.get(comment.parent_id)
+        if parent is not None:
+            parent.children.append(comment)
+    flat = []
+    stack = [nodes[pk] for pk in reversed(root_ids) if pk in nodes]
+    while stack:
+        comment = stack.pop()
+        flat.append(comment)
+        stack.extend(reversed(comment.children))
+    return flat
+
+
+def thread(root_id):
+    """Вся ветка комментария root_id в порядке вывода"""
+    return flatten(subtrees([root_id]), [root_id])
+
+
+def thread_page(post_id, cursor=None):
+    """Страница веток поста: COMMENTS_PER_PAGE новых корневых
+    комментариев (по курсору) и первые COMMENT_REPLIES_PER_THREAD
+    ответов каждого по (path, id).
+
+    Два запроса: корни по индексу (post, thread, -created) вместе
+    с границами веток и сами ветки. Ветки лежат в page.tree, курсор
+    считается по корням. У последнего показанного комментария
+    обрезанной ветки more_replies - курсор для comment_replies.
+    """
+    roots = with_reply_bounds(
+        Comment.objects.filter(post_id=post_id, thread__isnull=True),
+        yatube_conf.COMMENT_REPLIES_PER_THREAD)
+    page = CursorPaginator(roots.only('pk', 'created'),
+                           yatube_conf.COMMENTS_PER_PAGE,
+                           field='created').get_page(cursor)
+    root_ids = [root.pk for root in page]
+    bounds = {root.pk: (root.more_path, root.more_id)
+              for root in page if root.more_id is not None}
+    page.tree = (flatten(subtrees(root_ids, bounds), root_ids)
+                 if root_ids else [])
+    last = {}
+    for comment in page.tree:
+        last[comment.thread_id or comment.pk] = comment
+    for root_id, (path, pk) in bounds.items():
+        last[root_id].more_replies = encode_reply_cursor(path, pk)
+    # полные объекты корней вместо урезанных only()
+    page.object_list = [
+        comment for comment in page.tree if comment.thread_id is None]
+    return page
+
+
+def replies_page(post_id, root_id, cursor=None):
+    """Следующие COMMENT_REPLIES_PER_THREAD ответов ветки root_id
+    одним запросом, начиная с позиции cursor.
+
+    Ответы, чьи родители были показаны раньше, выводятся как начала
+    поддеревьев, отступ по-прежнему задает глубина.
+    """
+    limit = yatube_conf.COMMENT_REPLIES_PER_THREAD
+    replies = Comment.objects.select_related('author').filter(
+        post_id=post_id, thread_id=root_id).order_by('path', 'id')
+    position = decode_reply_cursor(cursor)
+    if position is not None:
+        replies = replies.filter(from_position(*position))
+    rows = list(replies[:limit + 1])
+    shown = rows[:limit]
+    ids = {comment.pk for comment in shown}
+    tree = flatten(shown, [comment.pk for comment in shown
+                           if comment.parent_id not in ids])
+    if len(rows) > limit:
+        tree[-1].more_replies = encode_reply_cursor(
+            rows[limit].path, rows[limit].pk)
+    return tree
@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from django.conf import settings as yatube_conf
+
+from .caching import bump_post_pages
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'thumbnail_pending:{post_id}'
+FAILED_KEY = 'thumbnail_failed:{post_id}'
+
+
+class PregeneratedThumbnailBackend(ThumbnailBackend):
+    """Backend sorl-thumbnail, который умеет только искать готовую миниатюру.
+
+    Имя миниатюры вычисляется так же, как в get_thumbnail,
+    но картинка при этом не открывается и не создается.
+    """
+
+    def _prepare(self, file_, geometry_string, options):
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_ready_thumbnail(self, file_, geometry_string, **options):
+        thumbnail = self._prepare(file_, geometry_string, options)
+        return default.kvstore.get(thumbnail)
+
+
+backend = PregeneratedThumbnailBackend()
+
+
+def generate_thumbnails(post_id):
+    """Создает миниатюры всех размеров POST_THUMBNAIL_SIZES для поста"""
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    for geometry, options in yatube_conf.POST_THUMBNAIL_SIZES.values():
+        backend.get_thumbnail(post.image, geometry, **options)
+    # страницы и карточки поста закешированы со ссылкой на оригинал
+    bump_post_pages(post)
+
+
+class ThumbnailQueue:
+    """Очередь фоновой генерации миниатюр в пуле потоков процесса"""
+
+    def __init__(self, workers, retries, retry_delay):
+        self.workers = workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='thumbnails',
+                )
+            return self._executor
+
+    def submit(self, post_id):
+        if self.workers:
+            return self.executor.submit(self.run, post_id)
+        return self.run(post_id)
+
+    def run(self, post_id):
+        for attempt in range(1, self.retries + 1):
+            try:
+                generate_thumbnails(post_id)
+                break
+            except Exception:
+                logger.warning('Миниатюры поста %s: попытка %s не удалась',
+                               post_id, attempt, exc_info=True)
+                if attempt < self.retries:
+                    time.sleep(self.retry_delay * attempt)
+            finally:
+                if self.workers:
+                    close_old_connections()
+        else:
+            logger.error('Миниатюры поста %s не созданы', post_id)
+            # иначе каждый показ поста снова ставил бы его в очередь
+            cache.set(FAILED_KEY.format(post_id=post_id), True,
+                      yatube_conf.POST_THUMBNAIL_FAILED_SECONDS)
+        cache.delete(PENDING_KEY.format(post_id=post_id))
+
+
+queue = ThumbnailQueue(
+    workers=yatube_conf.POST_THUMBNAIL_WORKERS,
+    retries=yatube_conf.POST_THUMBNAIL_RETRIES,
+    retry_delay=yatube_conf.POST_THUMBNAIL_RETRY_DELAY,
+)
+
+
+def schedule_thumbnails(post_id, new_image=False):
+    """Ставит пост в очередь после фиксации транзакции.
+
+    Пока задача в очереди, повторные вызовы для поста игнорируются.
+    Пост, миниатюры которого построить не удалось, снова ставится
+    только через POST_THUMBNAIL_FAILED_SECONDS или с новой картинкой.
+    """
+    failed_key = FAILED_KEY.format(post_id=post_id)
+    if new_image:
+        cache.delete(failed_key)
+    elif cache.get(failed_key):
+        return
+    if cache.add(PENDING_KEY.format(post_id=post_id), True,
+                 yatube_conf.POST_THUMBNAIL_PENDING_SECONDS):
+        transaction.on_commit(lambda: queue.submit(post_id))
+
+
+def ready_thumbnail_url(image, size):
+    """URL готовой миниатюры, иначе URL оригинала и постановка в очередь"""
+    geometry, options = yatube_conf.POST_THUMBNAIL_SIZES[size]
+    thumbnail = backend.get_ready_thumbnail(image, geometry, **options)
+    if thumbnail:
+        return thumbnail.url
+    schedule_thumbnails(image.instance.pk)
+    return image.url
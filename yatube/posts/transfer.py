@@ -0,0 +1,384 @@
+import csv
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from itertools import groupby, islice
+
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils.dateparse import parse_datetime
+
+from .caching import bump_generations
+from .counters import recount_all
+from .feeds import backfill_feeds
+from .models import Comment, Follow, Group, Post, StoredFile, User
+from .search import get_search_backend
+from .utils import invalidate_post_counts
+
+MODELS = ('group', 'post', 'comment', 'follow')
+
+# поля выгрузки: имя в файле -> путь для values_list
+EXPORT_FIELDS = {
+    'group': (Group, {
+        'title': 'title',
+        'slug': 'slug',
+        'description': 'description',
+    }),
+    'post': (Post, {
+        'id': 'pk',
+        'text': 'text',
+        'pub_date': 'pub_date',
+        'author': 'author__username',
+        'group': 'group__slug',
+        'image': 'image',
+        'image_width': 'image_width',
+        'image_height': 'image_height',
+    }),
+    'comment': (Comment, {
+        'id': 'pk',
+        'post': 'post_id',
+        'author': 'author__username',
+        'text': 'text',
+        'created': 'created',
+        'parent': 'parent_id',
+        'thread': 'thread_id',
+        'path': 'path',
+    }),
+    'follow': (Follow, {
+        'user': 'user__username',
+        'author': 'author__username',
+    }),
+}
+
+
+def export_records(models=MODELS, chunk_size=2000):
+    """Генератор пар (модель, словарь) по всем объектам.
+
+    Таблицы читаются iterator(chunk_size), поэтому в памяти
+    одновременно находится не больше одной пачки строк.
+    """
+    for name in models:
+        model, fields = EXPORT_FIELDS[name]
+        rows = model.objects.order_by('pk').values_list(*fields.values())
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield name, dict(zip(fields, row))
+
+
+def to_text(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def write_jsonl(stream, records):
+    count = 0
+    for name, record in records:
+        record = {key: to_text(value) for key, value in record.items()}
+        stream.write(json.dumps({'model': name, **record},
+                                ensure_ascii=False))
+        stream.write('\n')
+        count += 1
+    return count
+
+
+def read_jsonl(stream):
+    for line in stream:
+        if line.strip():
+            record = json.loads(line)
+            yield record.pop('model'), record
+
+
+def write_csv(directory, records):
+    """Пишет каждую модель в свой файл <модель>.csv в каталоге"""
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for name, group in groupby(records, key=lambda record: record[0]):
+        fields = EXPORT_FIELDS[name][1]
+        path = os.path.join(directory, f'{name}.csv')
+        with open(path, 'w', newline='', encoding='utf-8') as stream:
+            writer = csv.DictWriter(stream, fieldnames=list(fields))
+            writer.writeheader()
+            for _, record in group:
+                writer.writerow({key: '' if value is None else to_text(value)
+                                 for key, value in record.items()})
+                count += 1
+    return count
+
+
+def read_csv(directory):
+    for name in MODELS:
+        path = os.path.join(directory, f'{name}.csv')
+        if not os.path.exists(path):
+            continue
+        with open(path, newline='', encoding='utf-8') as stream:
+            for record in csv.DictReader(stream):
+                yield name, {key: value if value != '' else None
+                             for key, value in record.items()}
+
+
+def export_media(directory, chunk_size=2000):
+    """Копирует файлы картинок постов в каталог, сохраняя имена"""
+    storage = Post._meta.get_field('image').storage
+    names = Post.objects.exclude(image='').order_by().values_list(
+        'image', flat=True).distinct()
+    copied = 0
+    for name in names.iterator(chunk_size=chunk_size):
+        target = os.path.join(directory, name)
+        if os.path.exists(target) or not storage.exists(name):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with storage.open(name) as source, open(target, 'wb') as copy:
+            shutil.copyfileobj(source, copy)
+        copied += 1
+    return copied
+
+
+def sync_references(names):
+    """Выставляет число ссылок на файлы картинок по данным постов"""
+    refs = dict(Post.objects.filter(image__in=names).order_by()
+                .values_list('image').annotate(total=Count('pk')))
+    StoredFile.objects.bulk_create(
+        [StoredFile(name=name) for name in refs], ignore_conflicts=True)
+    for name, total in refs.items():
+        StoredFile.objects.filter(name=name).update(refs=total)
+
+
+def shift_path(path, offset):
+    """Путь комментария с id предков, сдвинутыми на offset"""
+    size = Comment.PATH_SEGMENT
+    return ''.join(
+        f'{int(path[start:start + size]) + offset:0{size}d}'
+        for start in range(0, len(path), size))
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+@contextmanager
+def keep_dates(*fields):
+    """Отключает auto_now_add, чтобы сохранить даты из выгрузки"""
+    saved = [field.auto_now_add for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in zip(fields, saved):
+            field.auto_now_add = value
+
+
+class Importer:
+    """Загружает записи пачками через bulk_create.
+
+    Пользователи и группы находятся по словарям в памяти, которые
+    дополняются одним запросом на пачку. id постов и комментариев
+    сдвигаются на наибольший id в базе к началу загрузки: в пустую
+    базу они попадают как есть, а в заполненную - без пересечений
+    с существующими строками, и комментарии не прикрепляются к чужим
+    постам. Комментарии к отсутствующим постам пропускаются и
+    считаются в orphans. Сигналы при bulk_create не работают, поэтому
+    finish пересчитывает счетчики, поисковый индекс, ленты и сбрасывает
+    кеш страниц.
+    """
+
+    def __init__(self, batch_size=1000, create_users=False, media=None):
+        self.batch_size = batch_size
+        self.create_users = create_users
+        self.media = media
+        self.users = {}
+        self.groups = {}
+        self.counts = dict.fromkeys(MODELS, 0)
+        self.skipped = 0
+        self.orphans = 0
+        self.authors = set()
+        self.images = set()
+        self.dropped_comments = set()
+        self.post_offset = None
+        self.comment_offset = None
+
+    def run(self, records):
+        for name, batch in self.batches(records):
+            with transaction.atomic():
+                getattr(self, f'load_{name}s')(batch)
+        self.finish()
+        return self.counts
+
+    def batches(self, records):
+        batch = []
+        current = None
+        for name, record in records:
+            if name not in EXPORT_FIELDS:
+                raise ValueError(f'Неизвестная модель: {name}')
+            if batch and (name != current or len(batch) >= self.batch_size):
+                yield current, batch
+                batch = []
+            current = name
+            batch.append(record)
+        if batch:
+            yield current, batch
+
+    def resolve_users(self, usernames):
+        missing = set(usernames) - set(self.users) - {None}
+        if not missing:
+            return
+        self.users.update(User.objects.filter(
+            username__in=missing).values_list('username', 'pk'))
+        missing -= set(self.users)
+        if missing and self.create_users:
+            User.objects.bulk_create(
+                [User(username=username, password='!')
+                 for username in missing],
+                ignore_conflicts=True,
+            )
+            self.users.update(User.objects.filter(
+                username__in=missing).values_list('username', 'pk'))
+
+    def resolve_groups(self, slugs):
+        missing = set(slugs) - set(self.groups) - {None}
+        if missing:
+            self.groups.update(Group.objects.filter(
+                slug__in=missing).values_list('slug', 'pk'))
+
+    def load_groups(self, batch):
+        self.resolve_groups(record['slug'] for record in batch)
+        new = [Group(title=record['title'], slug=record['slug'],
+                     description=record['description'])
+               for record in batch if record['slug'] not in self.groups]
+        Group.objects.bulk_create(new, ignore_conflicts=True)
+        self.groups.update(Group.objects.filter(
+            slug__in=[group.slug for group in new]
+        ).values_list('slug', 'pk'))
+        self.counts['group'] += len(new)
+
+    @staticmethod
+    def offset(model):
+        return model.objects.aggregate(last=Max('pk'))['last'] or 0
+
+    def load_posts(self, batch):
+        if self.post_offset is None:
+            self.post_offset = self.offset(Post)
+        self.resolve_users(record['author'] for record in batch)
+        self.resolve_groups(record['group'] for record in batch)
+        posts = []
+        for record in batch:
+            author_id = self.users.get(record['author'])
+            if author_id is None:
+                self.skipped += 1
+                continue
+            posts.append(Post(
+                id=int(record['id']) + self.post_offset,
+                text=record['text'],
+                pub_date=parse_datetime(record['pub_date']),
+                author_id=author_id,
+                group_id=self.groups.get(record['group']),
+                image=record['image'] or '',
+                image_width=record['image_width'] or None,
+                image_height=record['image_height'] or None,
+            ))
+            self.authors.add(author_id)
+            if record['image']:
+                self.images.add(record['image'])
+        with keep_dates(Post._meta.get_field('pub_date')):
+            Post.objects.bulk_create(posts)
+        self.counts['post'] += len(posts)
+
+    def load_comments(self, batch):
+        if self.comment_offset is None:
+            self.comment_offset = self.offset(Comment)
+        # выгрузка без постов ссылается на посты этой же базы
+        post_offset = self.post_offset or 0
+        offset = self.comment_offset
+        self.resolve_users(record['author'] for record in batch)
+        posts = set(Post.objects.filter(pk__in={
+            int(record['post']) + post_offset for record in batch
+        }).values_list('pk', flat=True))
+        comments = []
+        for record in batch:
+            comment_id = int(record['id'])
+            # в старых выгрузках полей ветки нет
+            parent_id = int(record.get('parent') or 0) or None
+            thread_id = int(record.get('thread') or 0) or None
+            author_id = self.users.get(record['author'])
+            post_id = int(record['post']) + post_offset
+            # ответы на пропущенные комментарии пропускаются вместе с ними
+            if author_id is None or parent_id in self.dropped_comments:
+                self.dropped_comments.add(comment_id)
+                self.skipped += 1
+                continue
+            if post_id not in posts:
+                self.dropped_comments.add(comment_id)
+                self.orphans += 1
+                continue
+            comments.append(Comment(
+                id=comment_id + offset,
+                post_id=post_id,
+                author_id=author_id,
+                text=record['text'],
+                created=parse_datetime(record['created']),
+                parent_id=parent_id and parent_id + offset,
+                thread_id=thread_id and thread_id + offset,
+                path=shift_path(record.get('path') or '', offset),
+            ))
+        with keep_dates(Comment._meta.get_field('created')):
+            Comment.objects.bulk_create(comments)
+        self.counts['comment'] += len(comments)
+
+    def load_follows(self, batch):
+        self.resolve_users(
+            username for record in batch
+            for username in (record['user'], record['author']))
+        follows = []
+        for record in batch:
+            user_id = self.users.get(record['user'])
+            author_id = self.users.get(record['author'])
+            if user_id is None or author_id is None or user_id == author_id:
+                self.skipped += 1
+                continue
+            follows.append(Follow(user_id=user_id, author_id=author_id))
+            self.authors.add(author_id)
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        self.counts['follow'] += len(follows)
+
+    def import_media(self):
+        storage = Post._meta.get_field('image').storage
+        save = getattr(storage, 'save_derived', storage.save)
+        for name in self.images:
+            source = os.path.join(self.media, name)
+            if storage.exists(name) or not os.path.exists(source):
+                continue
+            with open(source, 'rb') as stream:
+                save(name, stream)
+
+    def finish(self):
+        if self.media:
+            self.import_media()
+        if self.images:
+            sync_references(self.images)
+        recount_all(batch_size=self.batch_size)
+        get_search_backend().rebuild()
+        invalidate_post_counts(
+            'all',
+            *(f'group:{group_id}' for group_id in self.groups.values()),
+            *(f'author:{author_id}' for author_id in self.authors),
+        )
+        bump_generations('all', 'groups')
+        # ленты дополняются пачками подписок, память не растет
+        # с числом подписок
+        for authors in chunks(sorted(self.authors), self.batch_size):
+            follows = Follow.objects.filter(
+                author_id__in=authors
+            ).order_by().values_list('user_id', 'author_id')
+            for pairs in chunks(follows.iterator(), self.batch_size):
+                backfill_feeds(pairs)
+                followers = {user_id for user_id, _ in pairs}
+                invalidate_post_counts(
+                    *(f'follow:{user_id}' for user_id in followers))
+                bump_generations(
+                    *(f'viewer:{user_id}' for user_id in followers))
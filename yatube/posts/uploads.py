@@ -0,0 +1,120 @@
+import hashlib
+from functools import wraps
+from io import BytesIO
+
+from django.core.files.uploadhandler import (
+    SkipFile, TemporaryFileUploadHandler
+)
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image
+
+from django.conf import settings as yatube_conf
+
+
+MAGIC_NUMBERS = (
+    (b'\xff\xd8\xff', 0),
+    (b'\x89PNG\r\n\x1a\n', 0),
+    (b'GIF87a', 0),
+    (b'GIF89a', 0),
+    (b'WEBP', 8),
+)
+HEADER_LIMIT = 256 * 2 ** 10
+
+
+def has_image_magic(header):
+    """Похоже ли начало файла на JPEG, PNG, GIF или WebP"""
+    for magic, offset in MAGIC_NUMBERS:
+        if header[offset:offset + len(magic)] == magic:
+            return magic != b'WEBP' or header.startswith(b'RIFF')
+    return False
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет картинку во временный файл по частям и проверяет ее на лету.
+
+    Сигнатура формата проверяется по первым байтам, разрешение -
+    как только прочитан заголовок картинки, размер - по мере
+    получения. Неподходящий файл пропускается без дочитывания в
+    память, а причина записывается в request.rejected_uploads.
+    Принятый файл несет content_digest, чтобы хранилище не читало
+    его повторно для хеширования.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        request.rejected_uploads = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.header = b''
+        self.header_checked = False
+        self.sha = hashlib.sha256()
+
+    def reject(self, message):
+        self.file.close()
+        self.request.rejected_uploads[self.field_name] = message
+        raise SkipFile(message)
+
+    def check_header(self, raw_data):
+        self.header += raw_data[:HEADER_LIMIT - len(self.header)]
+        if not has_image_magic(self.header[:16]):
+            self.reject('Файл не является картинкой')
+        try:
+            with Image.open(BytesIO(self.header)) as image:
+                size = image.size
+        except Image.DecompressionBombError:
+            self.reject('Слишком большое разрешение картинки')
+        except Exception:
+            if len(self.header) >= HEADER_LIMIT:
+                self.reject('Не удалось прочитать заголовок картинки')
+            return
+        self.header_checked = True
+        self.header = b''
+        if size[0] * size[1] > yatube_conf.POST_IMAGE_MAX_PIXELS:
+            self.reject('Слишком большое разрешение картинки')
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > yatube_conf.POST_IMAGE_MAX_BYTES:
+            self.reject('Картинка больше %s МБ'
+                        % (yatube_conf.POST_IMAGE_MAX_BYTES // 2 ** 20))
+        if not self.header_checked:
+            self.check_header(raw_data)
+        self.sha.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        # SkipFile Django ловит только до конца файла, здесь отказ -
+        # это файл, которого нет (None), причина в rejected_uploads
+        try:
+            if not self.header_checked:
+                self.check_header(b'')
+                if not self.header_checked:
+                    self.reject('Не удалось прочитать заголовок картинки')
+        except SkipFile:
+            return None
+        upload = super().file_complete(file_size)
+        upload.content_digest = self.sha.hexdigest()
+        return upload
+
+
+def stream_image_uploads(view):
+    """Принимает файлы запроса через ImageUploadHandler.
+
+    Обработчики можно заменить только до чтения request.POST,
+    а его читает проверка CSRF, поэтому она выполняется здесь
+    после замены.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+    return wrapper
+
+
+def rejected_uploads(request):
+    return getattr(request, 'rejected_uploads', {})
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 
 app_name = 'posts'
@@ -13,6 +13,10 @@ urlpatterns = [
     path('posts/<post_id>/edit/', views.post_edit, name='post_edit'),
     path('posts/<int:post_id>/comment/',
          views.add_comment, name='add_comment'),
+    path('posts/<int:post_id>/comments/',
+         views.post_comments, name='post_comments'),
+    path('posts/<int:post_id>/comments/<int:comment_id>/replies/',
+         views.comment_replies, name='comment_replies'),
     path('follow/', views.follow_index, name='follow_index'),
     path(
         'profile/<str:username>/follow/',
@@ -24,4 +28,22 @@ urlpatterns = [
         views.profile_unfollow,
         name='profile_unfollow'
     ),
+    path('api/v1/posts/', api.api_list, {'resource': 'posts'},
+         name='api_posts'),
+    path('api/v1/posts/<int:key>/', api.api_detail, {'resource': 'posts'},
+         name='api_post'),
+    path('api/v1/groups/', api.api_list, {'resource': 'groups'},
+         name='api_groups'),
+    path('api/v1/groups/<slug:key>/', api.api_detail,
+         {'resource': 'groups'}, name='api_group'),
+    path('api/v1/comments/', api.api_list, {'resource': 'comments'},
+         name='api_comments'),
+    path('api/v1/comments/<int:key>/', api.api_detail,
+         {'resource': 'comments'}, name='api_comment'),
+    path('api/v1/follows/', api.api_list, {'resource': 'follows'},
+         name='api_follows'),
+    path('api/v1/follows/bulk/', api.api_follows_bulk,
+         name='api_follows_bulk'),
+    path('api/v1/follows/<int:key>/', api.api_detail,
+         {'resource': 'follows'}, name='api_follow'),
 ]
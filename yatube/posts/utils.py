@@ -1,12 +1,262 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+from collections.abc import Sequence
+
+from django.core.cache import cache
+from django.core.paginator import (
+    EmptyPage, Page, PageNotAnInteger, Paginator
+)
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 
 from django.conf import settings as yatube_conf
 
+from core.routers import pinned_to_primary
+
+from .caching import jittered
+
+
+CURSOR_AFTER = 'n'
+CURSOR_BEFORE = 'p'
+POST_COUNT_KEY = 'post_count:{scope}'
+
+
+def post_count_key(scope):
+    return POST_COUNT_KEY.format(scope=scope)
+
+
+def invalidate_post_counts(*scopes):
+    """Сбрасывает закешированные количества постов для областей"""
+    cache.delete_many([post_count_key(scope) for scope in scopes])
+
+
+def encode_cursor(direction, obj, field='pub_date'):
+    """Упаковывает позицию (дата, id) в непрозрачный токен"""
+    raw = f'{direction}|{getattr(obj, field).isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен. Для испорченного токена возвращает None"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, pub_date, pk = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in (CURSOR_AFTER, CURSOR_BEFORE) or pub_date is None:
+        return None
+    return direction, pub_date, pk
+
+
+class CursorPage(Sequence):
+    """Страница ленты, полученная по курсору"""
+    cursor_mode = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return encode_cursor(CURSOR_AFTER, self.object_list[-1],
+                             self.paginator.field)
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return encode_cursor(CURSOR_BEFORE, self.object_list[0],
+                             self.paginator.field)
+
+
+class CursorPaginator:
+    """Постраничный вывод по ключу (field, id), новые первыми.
+
+    Не выполняет COUNT(*) и OFFSET: каждая страница читается
+    диапазоном по индексу, поэтому глубина страницы не влияет на время.
+    field - поле даты: pub_date у постов, created у комментариев.
+    """
+
+    def __init__(self, object_list, per_page, field='pub_date'):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.field = field
+
+    def get_page(self, cursor=None):
+        field = self.field
+        position = decode_cursor(cursor) if cursor else None
+        if position is None:
+            rows = list(
+                self.object_list.order_by(f'-{field}', '-id')
+                [:self.per_page + 1]
+            )
+            return CursorPage(rows[:self.per_page], self,
+                              has_next=len(rows) > self.per_page,
+                              has_previous=False)
+        direction, value, pk = position
+        if direction == CURSOR_AFTER:
+            rows = list(
+                self.object_list.filter(
+                    Q(**{f'{field}__lt': value})
+                    | Q(**{field: value, 'id__lt': pk})
+                ).order_by(f'-{field}', '-id')[:self.per_page + 1]
+            )
+            return CursorPage(rows[:self.per_page], self,
+                              has_next=len(rows) > self.per_page,
+                              has_previous=True)
+        rows = list(
+            self.object_list.filter(
+                Q(**{f'{field}__gt': value})
+                | Q(**{field: value, 'id__gt': pk})
+            ).order_by(field, 'id')[:self.per_page + 1]
+        )
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return CursorPage(rows, self,
+                          has_next=True,
+                          has_previous=has_previous)
+
+
+class CountedPage(Page):
+    """Страница, о следующей странице которой известно по лишней строке"""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class CountedPaginator(Paginator):
+    """Paginator, который берет количество объектов из кеша.
+
+    Количество хранится по области (count_scope): вся лента, группа,
+    автор или лента подписок. Выше POST_COUNT_APPROXIMATE_ABOVE
+    точный COUNT(*) не выполняется, количество считается примерным.
+    Примерное количество только показывается: страница существует,
+    если на ней есть строки, а следующая - если нашлась лишняя строка.
+    """
+
+    def __init__(self, object_list, per_page, count_scope=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_scope = count_scope
+        self.approximate = False
+
+    def _bounded_count(self):
+        limit = yatube_conf.POST_COUNT_APPROXIMATE_ABOVE
+        if limit is None:
+            return super().count, False
+        count = self.object_list[:limit + 1].count()
+        if count > limit:
+            return limit, True
+        return count, False
+
+    def validate_number(self, number):
+        if self.count <= 0 or not self.approximate:
+            return super().validate_number(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть целым')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        # num_pages по примерному количеству страницы не ограничивает
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.approximate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('На этой странице нет результатов')
+        return CountedPage(rows[:self.per_page], number, self,
+                           has_next=len(rows) > self.per_page)
+
+    def get_page(self, number):
+        """Как Paginator.get_page, но страница за концом примерного
+        списка заменяется последней непустой, а не дает ошибку"""
+        try:
+            return super().get_page(number)
+        except EmptyPage:
+            return self.page(self.last_filled_page(number))
+
+    def last_filled_page(self, number):
+        """Последняя страница с постами до страницы number.
+
+        Строки считаются только до начала запрошенной страницы, то есть
+        не дальше, чем прочитал бы сам OFFSET.
+        """
+        bottom = (self.validate_number(number) - 1) * self.per_page
+        total = self.object_list[:bottom].count()
+        return max(1, -(-total // self.per_page))
+
+    @cached_property
+    def count(self):
+        if self.count_scope is None:
+            count, self.approximate = self._bounded_count()
+            return count
+        key = post_count_key(self.count_scope)
+        cached = cache.get(key)
+        if cached is None:
+            # количество попадает в общий кеш: считаем по основной базе
+            with pinned_to_primary():
+                cached = self._bounded_count()
+            cache.set(key, cached,
+                      jittered(yatube_conf.POST_COUNT_CACHE_SECONDS))
+        count, self.approximate = cached
+        return count
+
 
 def page_objects(request,
                  all_objects,
-                 div_counts=yatube_conf.COUNT_POSTS_IN_PAGE):
-    """Функция влзвращет объекты на оду страницу"""
-    paginator = Paginator(all_objects, div_counts)
+                 div_counts=yatube_conf.COUNT_POSTS_IN_PAGE,
+                 cursor=None,
+                 count_scope=None):
+    """Функция влзвращет объекты на оду страницу.
+
+    Курсорный режим включается настройкой FEED_CURSOR_PAGINATION
+    или параметром ?cursor= в запросе. count_scope задает ключ,
+    под которым кешируется количество постов.
+    """
+    if cursor is None:
+        cursor = (yatube_conf.FEED_CURSOR_PAGINATION
+                  or 'cursor' in request.GET)
+    if cursor:
+        paginator = CursorPaginator(all_objects, div_counts)
+        return paginator.get_page(request.GET.get('cursor'))
+    paginator = CountedPaginator(all_objects, div_counts,
+                                 count_scope=count_scope)
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
@@ -1,22 +1,36 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import require_GET
+
+from core.decorators import query_budget, read_replica, retry_on_locked
 
 from .models import Post, Group, Comment, User, Follow
+from .caching import cache_page_by_generation, condition_by_generation
+from .feeds import follow_feed
+from .follows import add_follows, remove_follows
 from .forms import PostForm, CommentForm
+from .images import store_image
+from .search import search_posts
+from .threads import replies_page, thread_page
+from .uploads import rejected_uploads, stream_image_uploads
 from .utils import page_objects
 from django.conf import settings as yatube_conf
 
 
-# @cache_page(yatube_conf.TIME_CACHE_SECONDS, key_prefix='index_page')
+@query_budget(4)
+@read_replica
+@cache_page_by_generation(yatube_conf.TIME_CACHE_SECONDS,
+                          key_prefix='index_page',
+                          scopes=lambda request: ['all', 'groups'])
 def index(request):
     keyword = request.GET.get("q", None)
     if keyword:
-        post_list = Post.objects.select_related(
-            'author', 'group').filter(text__contains=keyword)
+        post_list = search_posts(
+            Post.objects.select_related('author', 'group'), keyword)
+        page_obj = page_objects(request, post_list, cursor=False)
     else:
-        post_list = Post.objects.select_related('author')
-    page_obj = page_objects(request, post_list)
+        post_list = Post.objects.select_related('author', 'group')
+        page_obj = page_objects(request, post_list, count_scope='all')
     context = {
         'page_obj': page_obj,
         'keyword': keyword,
@@ -25,19 +39,36 @@ def index(request):
     return render(request, template, context)
 
 
+@query_budget(5)
+@read_replica
+@cache_page_by_generation(yatube_conf.TIME_CACHE_SECONDS,
+                          key_prefix='group_page',
+                          scopes=lambda request, slug: [
+                              f'group:{slug}', 'groups'])
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = Post.objects.filter(group=group)
-    page_obj = page_objects(request, post_list)
+    post_list = Post.objects.select_related(
+        'author', 'group').filter(group=group)
+    page_obj = page_objects(request, post_list,
+                            count_scope=f'group:{group.pk}')
     context = {'page_obj': page_obj}
     template = 'posts/group_list.html'
     return render(request, template, context)
 
 
+@query_budget(6)
+@read_replica
+@cache_page_by_generation(yatube_conf.TIME_CACHE_SECONDS,
+                          key_prefix='profile_page',
+                          scopes=lambda request, username: [
+                              f'profile:{username}', 'groups'])
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    post_list = Post.objects.filter(author=user)
-    page_obj = page_objects(request, post_list)
+    user = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    post_list = Post.objects.select_related(
+        'author', 'group').filter(author=user)
+    page_obj = page_objects(request, post_list,
+                            count_scope=f'author:{user.pk}')
     if request.user.is_authenticated:
         following = Follow.objects.filter(
             user=request.user, author=user).exists()
@@ -50,41 +81,128 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+def post_detail_scopes(request, post_id):
+    """Области страницы поста: сам пост, счетчики автора, имена и группы"""
+    found = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'author__username').first()
+    if found is None:
+        return None
+    author_id, username = found
+    return [f'post:{post_id}', f'author:{author_id}',
+            f'profile:{username}', 'groups']
+
+
+@query_budget(6)
+@read_replica
+@condition_by_generation('post_page', scopes=post_detail_scopes)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    comments = Comment.objects.filter(post=post)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id)
+    reply_to = request.GET.get('reply', '')
     context = {
         'post': post,
-        'comments': comments,
-        'form': CommentForm()
+        'comments': thread_page(post_id),
+        'form': CommentForm(),
+        'reply_to': reply_to if reply_to.isdigit() else '',
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@query_budget(2)
+@read_replica
+@require_GET
+@cache_page_by_generation(yatube_conf.TIME_CACHE_SECONDS,
+                          key_prefix='comments_page',
+                          scopes=lambda request, post_id: [
+                              f'post:{post_id}', 'groups'])
+def post_comments(request, post_id):
+    """Следующая страница веток комментариев (?cursor=) фрагментом HTML.
+
+    Страница поста показывает первые COMMENTS_PER_PAGE веток,
+    остальные подгружаются кнопкой. В JSON те же комментарии отдает
+    API: /api/v1/comments/?post=<id>.
+    """
+    page = thread_page(post_id, request.GET.get('cursor'))
+    return render(request, 'posts/includes/comment_list.html',
+                  {'comments': page, 'post_id': post_id})
+
+
+@query_budget(1)
+@read_replica
+@require_GET
+@cache_page_by_generation(yatube_conf.TIME_CACHE_SECONDS,
+                          key_prefix='replies_page',
+                          scopes=lambda request, post_id, comment_id: [
+                              f'post:{post_id}', 'groups'])
+def comment_replies(request, post_id, comment_id):
+    """Следующие ответы ветки (?cursor=) фрагментом HTML.
+
+    Страница поста показывает первые COMMENT_REPLIES_PER_THREAD
+    ответов каждой ветки, остальные подгружаются кнопкой.
+    """
+    tree = replies_page(post_id, comment_id, request.GET.get('cursor'))
+    return render(request, 'posts/includes/comment_list.html',
+                  {'comments': {'tree': tree}, 'post_id': post_id})
+
+
+def save_post(post):
+    """Сохраняет пост из формы.
+
+    Картинка уже обработана при проверке формы, ее файлы пишутся
+    до транзакции, а под блокировкой записи выполняются только
+    запросы. Если пост так и не сохранился, ссылка на файл снимается.
+    """
+    stored = store_image(post)
+    initial = (post._initial_group_id, post._initial_author_id,
+               post._initial_image)
+
+    @retry_on_locked
+    def write():
+        # неудачная попытка не должна менять то, с чем сравнивают сигналы
+        (post._initial_group_id, post._initial_author_id,
+         post._initial_image) = initial
+        post._image_stored = stored
+        post.save()
+
+    try:
+        write()
+    except Exception:
+        if stored:
+            post.image.storage.delete(post.image.name)
+        raise
+
+
+@query_budget(14)
 @login_required
+@stream_image_uploads
 def post_create(request):
-    form = PostForm(request.POST or None, files=request.FILES or None)
+    form = PostForm(request.POST or None,
+                    files=request.FILES or None,
+                    upload_errors=rejected_uploads(request))
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        save_post(post)
         return redirect('posts:profile', request.user)
     return render(request, 'posts/create_post.html', {'form': form})
 
 
+@query_budget(10)
 @login_required
+@stream_image_uploads
 def post_edit(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     if request.user != post.author:
         return redirect('posts:profile', post.author)
     form = PostForm(request.POST or None,
                     files=request.FILES or None,
-                    instance=post)
+                    instance=post,
+                    upload_errors=rejected_uploads(request))
     if form.is_valid():
         post = form.save(commit=False)
         post.id = post_id
         post.author = request.user
-        post.save()
+        save_post(post)
         return redirect('posts:post_detail', post_id)
     return render(
         request,
@@ -93,6 +211,7 @@ def post_edit(request, post_id):
     )
 
 
+@query_budget(5)
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -101,15 +220,26 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        parent_id = request.POST.get('parent', '')
+        if parent_id.isdigit():
+            parent = Comment.objects.filter(
+                pk=parent_id, post_id=post_id
+            ).only('id', 'path', 'thread_id', 'parent_id').first()
+            if parent is not None:
+                comment.reply_to(parent, yatube_conf.COMMENT_MAX_DEPTH)
+        retry_on_locked(comment.save)()
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(5)
+@read_replica
 @login_required
+@condition_by_generation('follow_page',
+                         scopes=lambda request: ['all', 'groups'])
 def follow_index(request):
-    all_posts = Post.objects.select_related('author')
-    post_list = all_posts.filter(author__following__user=request.user)
-    page_obj = page_objects(request, post_list)
+    post_list = follow_feed(request.user).select_related('author', 'group')
+    page_obj = page_objects(request, post_list,
+                            count_scope=f'follow:{request.user.pk}')
     context = {
         'page_obj': page_obj,
     }
@@ -117,20 +247,17 @@ def follow_index(request):
     return render(request, template, context)
 
 
+@query_budget(11)
 @login_required
 def profile_follow(request, username):
     follow_to = get_object_or_404(User, username=username)
-    already_follower = Follow.objects.filter(
-        user=request.user, author=follow_to)
-    if not (already_follower.exists()):
-        if (request.user != follow_to):
-            Follow.objects.create(user=request.user, author=follow_to)
+    retry_on_locked(add_follows)([(request.user.pk, follow_to.pk)])
     return redirect('posts:profile', username=follow_to)
 
 
+@query_budget(10)
 @login_required
 def profile_unfollow(request, username):
     unfollow_to = get_object_or_404(User, username=username)
-    Follow.objects.filter(
-        user=request.user, author=unfollow_to).delete()
+    retry_on_locked(remove_follows)([(request.user.pk, unfollow_to.pk)])
     return redirect('posts:follow_index')
@@ -0,0 +1,36 @@
+// Подгрузка следующих страниц комментариев вместо перехода по ссылке
+document.addEventListener('click', function (event) {
+  var link = event.target.closest('[data-comments-more]');
+  if (!link) {
+    return;
+  }
+  event.preventDefault();
+  link.classList.add('disabled');
+  fetch(link.href, {credentials: 'same-origin'})
+    .then(function (response) {
+      if (!response.ok) {
+        throw new Error(response.status);
+      }
+      return response.text();
+    })
+    .then(function (html) {
+      link.insertAdjacentHTML('afterend', html);
+      link.remove();
+    })
+    .catch(function () {
+      link.classList.remove('disabled');
+    });
+});
+
+// Ответ на комментарий: та же форма, родитель в скрытом поле
+document.addEventListener('click', function (event) {
+  var link = event.target.closest('[data-reply]');
+  var form = document.getElementById('comment-form');
+  if (!link || !form) {
+    return;
+  }
+  event.preventDefault();
+  form.elements.parent.value = link.dataset.reply;
+  form.scrollIntoView();
+  form.elements.text.focus();
+});
@@ -1,4 +1,6 @@
 import os
+import sys
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -44,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMiddleware',
+    'core.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,7 +62,7 @@ ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backend.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -85,11 +89,49 @@ INTERNAL_IPS = [
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # SQLite с BEGIN IMMEDIATE для retry_on_locked
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': int(os.environ.get('YATUBE_CONN_MAX_AGE', 60)),
+        'OPTIONS': {
+            # сколько секунд ждать блокировку записи
+            'timeout': 20,
+        },
     }
 }
 
+DATABASE_REPLICAS = []
+"""Алиасы баз-реплик для чтения, файлы задает YATUBE_REPLICAS через запятую"""
+
+for number, path in enumerate(
+        filter(None, os.environ.get('YATUBE_REPLICAS', '').split(','))):
+    DATABASE_REPLICAS.append(f'replica_{number}')
+    DATABASES[f'replica_{number}'] = dict(
+        DATABASES['default'], NAME=path, TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+
+REPLICA_PIN_COOKIE = 'yatube_primary'
+"""Cookie, пока она есть, чтения пользователя идут в основную базу"""
+
+REPLICA_PIN_SECONDS = 10
+"""Сколько секунд после записи читать из основной базы (отставание реплик)"""
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 2 ** 20,
+    'cache_size': -64 * 2 ** 10,
+    'temp_store': 'MEMORY',
+}
+"""PRAGMA для каждого нового соединения с SQLite (cache_size < 0 - в КиБ)"""
+
+SQLITE_LOCKED_RETRIES = 5
+"""Сколько раз повторять изменяющее представление при занятой базе"""
+
+SQLITE_LOCKED_RETRY_DELAY = 0.05
+"""Первая пауза перед повтором (в секундах), дальше растет вдвое"""
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -146,14 +188,159 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 
+CACHE_URL = os.environ.get('YATUBE_CACHE_URL')
+"""Адрес общего кеша (redis://...). Без него общий кеш - файл SQLite"""
+
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+"""Запуск тестов: общий кеш в памяти процесса, чтобы параллельные прогоны
+и cache.clear() в тестах не задевали кеш сервера разработки"""
+
 CACHES = {
     'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'tiered',
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,
+            # только ключи с поколением в имени, остальные - сразу в L2
+            'L1_PREFIXES': ('page:', 'post_card:'),
+        },
+    },
+    'shared': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'LOCATION': 'shared',
+    } if TESTING else {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': CACHE_URL,
+    } if CACHE_URL else {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(),
+                                 'yatube-cache.sqlite3'),
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
 }
+"""default - L1 в памяти процесса перед общим для воркеров кешем shared"""
+
+TIME_CACHE_SECONDS = 60 * 5
+"""Время кеширования index, group_posts и profile (в секундах).
+Изменения сбрасывают кеш сигналами, срок нужен только для очистки памяти"""
+
+CACHE_TTL_JITTER = 0.1
+"""Разброс сроков хранения в кеше (доля), чтобы записи не истекали разом"""
+
+PAGE_CACHE_STALE_SECONDS = 60
+"""Сколько отдавать старую страницу, пока один запрос строит новую"""
 
-TIME_CACHE_SECONDS = 1 * 20
-"""Время кеширования index (в секундах)"""
+PAGE_CACHE_LOCK_SECONDS = 10
+"""Срок блокировки перестройки страницы на случай падения процесса"""
+
+PAGE_CACHE_WAIT_SECONDS = 0.5
+"""Сколько ждать чужую перестройку, если старой страницы нет совсем"""
 
 COUNT_POSTS_IN_PAGE = 10
 """Количество постов на странице для Paginator"""
+
+API_MAX_LIMIT = 100
+"""Наибольший размер страницы API (?limit=)"""
+
+FOLLOW_BULK_MAX = 500
+"""Наибольшее число имен в одном запросе массовой подписки API"""
+
+COMMENTS_PER_PAGE = 20
+"""Комментариев на странице поста и в каждой подгружаемой порции"""
+
+COMMENT_MAX_DEPTH = 5
+"""Глубина ветки комментариев: ответы глубже прикрепляются к родителю
+ответа и показываются на последнем уровне"""
+
+COMMENT_REPLIES_PER_THREAD = 10
+"""Ответов ветки, показываемых сразу и подгружаемых за раз"""
+
+FEED_CURSOR_PAGINATION = False
+"""Курсорная пагинация лент по (pub_date, id) вместо номеров страниц"""
+
+POST_COUNT_CACHE_SECONDS = 60 * 10
+"""Время хранения количества постов ленты в кеше (в секундах)"""
+
+POST_COUNT_APPROXIMATE_ABOVE = 10000
+"""Выше этого числа посты ленты не пересчитываются точно (None - всегда)"""
+
+POSTS_SEARCH_BACKEND = 'posts.search.SQLiteFTSSearchBackend'
+"""Движок поиска по постам (для PostgreSQL - PostgresSearchBackend)"""
+
+FEED_FANOUT_MAX_FOLLOWERS = 5000
+"""Посты авторов с большим числом подписчиков не раскладываются по лентам"""
+
+FEED_BACKFILL_POSTS = 500
+"""Сколько последних постов автора добавлять в ленту при подписке"""
+
+QUERY_BUDGET_RAISE = False
+"""Превышение бюджета запросов представления - исключение, а не запись в лог"""
+
+BENCHMARK_BASELINE = os.path.join(BASE_DIR, 'benchmarks', 'baseline.json')
+"""Файл базового прогона benchmark_yatube для сравнения регрессий"""
+
+PERF_LOG_SAMPLE_RATE = 0 if TESTING else 0.01
+"""Доля запросов, показатели которых пишутся в лог yatube.performance;
+тесты, которым нужен лог, включают его сами"""
+
+PERF_SLOW_REQUEST_MS = 500
+"""Запросы дольше этого пишутся в лог всегда (None - выкл.); SQL
+запоминается только у запросов из выборки"""
+
+PERF_SLOW_MAX_QUERIES = 200
+"""Сколько SQL-запросов запоминать для лога медленного запроса"""
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'performance': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'yatube.performance': {
+            'handlers': ['performance'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+POST_THUMBNAIL_SIZES = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+    'detail': ('960', {'crop': 'center', 'upscale': True}),
+}
+"""Размеры миниатюр картинок постов, создаются заранее при сохранении"""
+
+POST_THUMBNAIL_WORKERS = 2
+"""Потоков генерации миниатюр в процессе (0 - сразу после сохранения)"""
+
+POST_THUMBNAIL_RETRIES = 3
+"""Сколько раз пытаться построить миниатюры поста, включая первую попытку"""
+
+POST_THUMBNAIL_RETRY_DELAY = 1
+"""Пауза перед повтором в секундах, растет с номером попытки"""
+
+POST_THUMBNAIL_PENDING_SECONDS = 60
+"""Сколько секунд пост считается стоящим в очереди миниатюр"""
+
+POST_THUMBNAIL_FAILED_SECONDS = 60 * 60
+"""Сколько секунд не ставить снова пост, миниатюры которого не удались"""
+
+POST_IMAGE_MAX_BYTES = 10 * 2 ** 20
+"""Максимальный размер загружаемой картинки поста в байтах"""
+
+POST_IMAGE_MAX_PIXELS = 40_000_000
+"""Максимальное разрешение картинки (ширина * высота) до уменьшения"""
+
+POST_IMAGE_MAX_EDGE = 2048
+"""Картинки с большей стороной длиннее уменьшаются до этого размера"""
+
+POST_IMAGE_QUALITY = 85
+"""Качество перекодирования JPEG и вариантов WebP/AVIF"""
+
+POST_IMAGE_VARIANTS = ('webp', 'avif')
+"""Сжатые варианты рядом с оригиналом, если Pillow умеет их сохранять"""